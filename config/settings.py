@@ -145,4 +145,8 @@ TEST_RUNNER='config.customization.flexup_testrunner.FlexUpTestRunner'
 # Or if you want prints enabled by default in test functions:
 os.environ.setdefault('DEBUG_PRINTS', 'test')
 
+# Shared memory exchange rate table: name of the segment written by the `refresh_shared_rates` command and read by all the workers
+# Leave empty to disable the table (rates are then read from the database)
+EXCHANGE_RATE_SHARED_MEMORY = os.environ.get('EXCHANGE_RATE_SHARED_MEMORY') or None
+
 AUTHENTICATION_BACKENDS = ["core.models.flexup_auth_backend.FlexUpAuthBackend"]
@@ -0,0 +1,171 @@
+# -------- core/benchmarks.py
+""" Micro-benchmarks of the hot paths of the project, run with `python manage.py benchmark <name>` (see BENCHMARKS). """
+import importlib.util
+import os
+import random
+import subprocess
+import sys
+import timeit
+from unittest.mock import patch
+
+from django.db import models
+
+from core.models.flexup_enum_field import FlexUpEnumField
+
+
+def _time_per_call(function, number: int, repeat: int = 5) -> float:
+    """ Return the best time of one call of function (in seconds), over repeat series of number calls. """
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+def _linear_from_db_value(field, value):
+    """ Previous implementation of FlexUpEnumField.from_db_value (linear scan of the enum), kept as the reference of the benchmark. """
+    if value is not None:
+        for choice in field.flexup_enum:
+            if choice.value == value:
+                return choice
+    return None
+
+
+def benchmark_enum_hydration(rows: int = 100_000, model: str = 'product.Product') -> list:
+    """ - Measure the cost of converting the enum columns of the rows of a model from the database values (FlexUpEnumField.from_db_value),
+    without the database itself.
+    - Returns:
+        - list of (label, seconds): the time to hydrate the enum columns of all the rows, with the previous and the current implementation.
+    """
+    from django.apps import apps
+
+    fields = [field for field in apps.get_model(model)._meta.concrete_fields if isinstance(field, FlexUpEnumField)]
+    sample = [[random.choice(list(field.flexup_enum)).value for field in fields] for _row in range(1000)]  # random values of each enum column
+
+    def hydrate(from_db_value):
+        return lambda: [[from_db_value(field, value) for field, value in zip(fields, values)] for values in sample]
+
+    current = lambda field, value: field.from_db_value(value, None, None)
+    factor = rows / len(sample)
+    return [
+        (f"linear scan, {rows} rows x {len(fields)} enum columns", _time_per_call(hydrate(_linear_from_db_value), 1, 3) * factor),
+        (f"hash lookup, {rows} rows x {len(fields)} enum columns", _time_per_call(hydrate(current), 1, 3) * factor),
+    ]
+
+
+def _inline_choices_deconstruct(field):
+    """ Previous implementation of FlexUpEnumField.deconstruct (the choices inlined in the migrations), kept as the reference of the benchmark. """
+    name, path, args, kwargs = models.CharField.deconstruct(field)
+    kwargs['flexup_enum'] = field.flexup_enum
+    return name, path, args, kwargs
+
+
+def benchmark_migration_autodetector(runs: int = 5) -> list:
+    """ - Measure the time of the migration autodetector of makemigrations (load the state of the migrations, build the state of the models
+    and compare them), with the choices of the enum fields inlined in the deconstructed fields as before, and with the current deconstruct.
+    - Returns:
+        - list of (label, seconds)
+    """
+    from django.apps import apps
+    from django.db.migrations.autodetector import MigrationAutodetector
+    from django.db.migrations.loader import MigrationLoader
+    from django.db.migrations.state import ProjectState
+
+    def autodetect():
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        changes = MigrationAutodetector(loader.project_state(), ProjectState.from_apps(apps)).changes(graph=loader.graph)
+        assert not changes, f"The models have changes without migrations: {changes}"
+
+    current = _time_per_call(autodetect, 1, runs)
+    with patch.object(FlexUpEnumField, 'deconstruct', _inline_choices_deconstruct):
+        inlined = _time_per_call(autodetect, 1, runs)
+    return [
+        ("makemigrations autodetector, choices inlined", inlined),
+        ("makemigrations autodetector, enum referenced", current),
+    ]
+
+
+def _choices_loop_validate(field, value, model_instance):
+    """ Previous validation of the enum fields (Field.validate, comparing the value to each choice), kept as the reference of the benchmark. """
+    models.Field.validate(field, value, model_instance)
+
+
+def benchmark_product_save(rows: int = 1000) -> list:
+    """ - Measure the validation of the enum fields of products (run by full_clean on each save), and the throughput of saving products
+    (in a transaction rolled back), with the previous and the current validation of the choices.
+    - Returns:
+        - list of (label, seconds): the time for all the rows
+    """
+    from decimal import Decimal
+
+    from django.db import transaction
+
+    from core.enums.currency import Currency
+    from core.enums.general import Focus, Visibility
+    from core.enums.status import Status
+    from core.utils.convert_currency import cache_stored_exchange_rates
+    from product.enums import SystemUnit
+    from product.models import Product
+
+    product = Product(name="Benchmark", price_excluding_tax=Decimal("100.00"), currency=Currency.USD, system_unit=SystemUnit.KG,
+                      status=Status.ACTIVE, visibility=Visibility.PUBLIC, focus=Focus.STARRED)
+    fields = [(field, getattr(product, field.attname)) for field in Product._meta.concrete_fields if isinstance(field, FlexUpEnumField)]
+
+    def validate():
+        for _row in range(rows):
+            for field, value in fields:
+                field.validate(value, product)
+
+    def save():
+        with transaction.atomic(), cache_stored_exchange_rates():
+            for _row in range(rows):
+                Product(name=product.name, price_excluding_tax=product.price_excluding_tax, currency=product.currency, system_unit=product.system_unit,
+                        status=product.status, visibility=product.visibility, focus=product.focus).save()
+            transaction.set_rollback(True)
+
+    results = []
+    for label, function, number in (("validate the enum fields", validate, 5), ("save", save, 1)):
+        with patch.object(FlexUpEnumField, 'validate', _choices_loop_validate):
+            results.append((f"{label} of {rows} products, comparison to each choice", _time_per_call(function, number, 3)))
+        results.append((f"{label} of {rows} products, set of the choice values", _time_per_call(function, number, 3)))
+    return results
+
+
+ENUM_MODULES = ('core.enums.currency', 'core.enums.language', 'core.enums.country')
+
+
+def _import_times(modules, runs: int) -> dict:
+    """ Return the best cumulative import time (in seconds) of each module, over runs fresh interpreters starting Django (python -X importtime). """
+    code = f"import django; django.setup(); import {', '.join(modules)}"
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings')}
+    times = {}
+    for _run in range(runs):
+        stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, capture_output=True, text=True, check=True).stderr
+        for line in stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            _self, cumulative, module = line.removeprefix('import time:').split('|')
+            module = module.strip()
+            if module in modules:
+                times[module] = min(times.get(module, float('inf')), int(cumulative) / 1_000_000)
+    return times
+
+
+def benchmark_enum_import(runs: int = 5) -> list:
+    """ - Measure the import time of the largest enums:
+        - the cumulative time to import each module in a fresh interpreter (including its dependencies not imported yet, eg. core.models.flexup_enum
+          for the first one), as paid by each worker and each manage.py command,
+        - the time to build each enum class alone, by running the module again (its dependencies are already imported).
+    - Returns:
+        - list of (label, seconds)
+    """
+    results = [(f"import {module}, fresh interpreter", seconds) for module, seconds in _import_times(ENUM_MODULES, runs).items()]
+    for module in ENUM_MODULES:
+        spec = importlib.util.find_spec(module)
+        code = spec.loader.get_code(module)
+        build = lambda: exec(code, {'__name__': module, '__package__': spec.parent, '__file__': spec.origin})
+        results.append((f"build the enum of {module}", _time_per_call(build, 1, runs)))
+    return results
+
+
+BENCHMARKS = {
+    'enum_hydration': benchmark_enum_hydration,
+    'enum_import': benchmark_enum_import,
+    'migration_autodetector': benchmark_migration_autodetector,
+    'product_save': benchmark_product_save,
+}
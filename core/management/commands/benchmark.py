@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = f"Run micro-benchmarks of the hot paths of the project: {', '.join(BENCHMARKS)}."
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="Benchmarks to run (all by default)")
+
+    def handle(self, *args, **options):
+        unknown = set(options["names"]) - BENCHMARKS.keys()
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+        for name in options["names"] or BENCHMARKS:
+            self.stdout.write(f"{name}:")
+            for label, seconds in BENCHMARKS[name]():
+                self.stdout.write(f"  {label}: {seconds * 1000:.2f} ms")
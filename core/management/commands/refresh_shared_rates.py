@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils.shared_rate_table import SharedRateTable
+
+
+class Command(BaseCommand):
+    help = "Create the shared memory exchange rate table and keep it in sync with the database (single refresher process)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--name", default=None, help="Name of the shared memory segment (default: EXCHANGE_RATE_SHARED_MEMORY setting)")
+        parser.add_argument("--interval", type=float, default=60, help="Seconds between two refreshes")
+        parser.add_argument("--once", action="store_true", help="Refresh the table once and exit, leaving the segment in place")
+
+    def handle(self, *args, **options):
+        name = options["name"] or settings.EXCHANGE_RATE_SHARED_MEMORY
+        if not name:
+            raise CommandError("Provide --name or set EXCHANGE_RATE_SHARED_MEMORY")
+
+        try:
+            table = SharedRateTable.create(name)
+        except FileExistsError:
+            table = SharedRateTable.attach(name)  # restart of the refresher: reuse the segment the workers are attached to
+
+        try:
+            while True:
+                count = table.refresh_from_database()
+                self.stdout.write(f"{count} exchange rates written to '{name}' (version {table.version})")
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            table.unlink()
+        finally:
+            table.close()
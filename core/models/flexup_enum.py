@@ -1,9 +1,19 @@
 # -------- core/models/flexup_enum.py
+from decimal import Decimal
+from enum import Enum
+from pathlib import Path
+
 from enum_properties import EnumProperties
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.signals import setting_changed
+from django.db import models
+from django.dispatch import receiver
+from django.utils.autoreload import file_changed
+from django.utils.functional import Promise
+from django.utils.translation import get_language
 from django.utils.translation import gettext_lazy as _
 
-from utils.print_object import _print_object
-
 class ClassPropertyDescriptor:
     """A descriptor that enables defining class properties in the class body.
 
@@ -31,6 +41,162 @@ def classproperty(func):
     return ClassPropertyDescriptor(func)
 
 
+_NOT_NONE = object()  # key of the items whose property is not None, in the property indexes
+_property_indexes = {}  # {(enum class, property name): {property value: tuple of items}}, see _get_property_index
+
+
+def _get_property_index(cls, property_name):
+    """ - Return the inverted index of a property of an enum: {property value: tuple of the items with this value}, built on first use.
+    - The items of a list-valued property (eg. Country.currencies) are indexed by the whole list (as a tuple) and by each of its elements.
+    - The items are kept in the order of the enum. The items whose property is None are indexed under None, the other items under _NOT_NONE too.
+    - Raises:
+        - AttributeError: If the property does not exist.
+    """
+    key = (cls, property_name)
+    index = _property_indexes.get(key)
+    if index is None:
+        index = {_NOT_NONE: []}
+        for item in cls:
+            property_value = getattr(item, property_name)
+            if property_value is None:
+                index.setdefault(None, []).append(item)  # found by find_by_property(property_name, None), but not under _NOT_NONE
+                continue
+            index[_NOT_NONE].append(item)
+            values = [property_value]
+            if isinstance(property_value, (list, tuple)):
+                values = [tuple(property_value), *property_value]
+            # The enum items hash by name: index them by value too, as they are equal to their value (eg. Dimension.WEIGHT and "W")
+            values += [value.value for value in values if isinstance(value, Enum)]
+            for value in values:
+                try:
+                    items = index.setdefault(value, [])
+                except TypeError:
+                    continue  # unhashable values are only found by find_by_property's comparison of each item
+                if not items or items[-1] is not item:
+                    items.append(item)
+        index = {value: tuple(items) for value, items in index.items()}
+        _property_indexes[key] = index
+    return index
+
+
+_valid_values = {}  # {(enum class, id of the short list, property name, property value): (short list, frozenset of values)}, see _get_valid_values
+_VALID_VALUES_MAX_SIZE = 1024  # the cache is cleared beyond this size, in case short lists are built on each call
+
+
+def _get_valid_values(cls, short_list, property_name, property_value):
+    """ - Return the frozenset of the values accepted by is_valid for these filters, built on first use.
+    - The short lists are usually module constants (eg. ProductStatuses), so they are cached by identity, which avoids reading them on each call.
+      The short list is kept in the cache, so that its id cannot be reused by another list while cached.
+    - Raises:
+        - TypeError: If the property value is unhashable.
+    """
+    if isinstance(property_value, list):
+        property_value = tuple(property_value)
+    key = (cls, id(short_list) if short_list else None, property_name, property_value or None)
+    cached = _valid_values.get(key)
+    if cached is not None:
+        return cached[1]
+
+    valid_values = None
+    if short_list:
+        # Handle both enum instances and (value, label) tuples in short_list
+        valid_values = {item.value if isinstance(item, cls) else item[0] for item in short_list if isinstance(item, (cls, tuple))}
+    if property_name:
+        if property_value:
+            items = _get_property_index(cls, property_name).get(property_value, ())
+        else:
+            try:
+                items = _get_property_index(cls, property_name)[_NOT_NONE]
+            except AttributeError:
+                items = ()
+        property_values = {item.value for item in items}
+        valid_values = property_values if valid_values is None else valid_values & property_values
+    if valid_values is None:
+        valid_values = cls._value2member_map_.keys()
+
+    if len(_valid_values) >= _VALID_VALUES_MAX_SIZE:
+        _valid_values.clear()
+    valid_values = frozenset(valid_values)
+    _valid_values[key] = (short_list, valid_values)
+    return valid_values
+
+
+_sort_keys = {}  # {(enum class, property name): {value: sort key}}, see _get_sort_keys
+
+
+def _get_sort_keys(cls, property_name=None):
+    """ - Return the sort key of each value of an enum, computed on first use: its position in the enum, or the value of the property. """
+    key = (cls, property_name)
+    sort_keys = _sort_keys.get(key)
+    if sort_keys is None:
+        if property_name is None:
+            sort_keys = {item._value_: ordinal for ordinal, item in enumerate(cls)}
+        else:
+            sort_keys = {item._value_: getattr(item, property_name) for item in cls}
+        _sort_keys[key] = sort_keys
+    return sort_keys
+
+
+def _get_db_sort_key(key):
+    """ - Return a sort key of a property value (see _get_sort_keys) that the database can compare, for sort_case.
+    - An item of an enum is sorted by its position in its enum (like the items in Python, see __lt__), and a lazy text (eg. a label) by its translation in the active language.
+    - Raises:
+        - ValidationError: If the value is not a number, a text or an enum item (eg. a list).
+    """
+    if isinstance(key, FlexUpEnum):
+        return _get_sort_keys(type(key))[key._value_]
+    if isinstance(key, Enum):
+        key = key.value
+    if isinstance(key, Promise):
+        return str(key)
+    if not isinstance(key, (int, float, Decimal, str)):
+        raise ValidationError(_(f"Cannot sort by {key!r} in the database: the sort keys must be numbers, texts or enum items."))
+    return key
+
+
+_choices = {}  # {(enum class, language, kind, arguments): list of (value, label) tuples}, see _get_choices
+
+
+def _get_choices(cls, kind, arguments, items):
+    """ - Return the choices (value, label) of the items, cached for each active language, with the labels translated once.
+    - Before the apps are ready (eg. the choices of the model fields), the translations cannot be evaluated: the labels are kept lazy, and not cached.
+    - The cached lists are shared between the callers: they must not be modified.
+    - Args:
+        - kind (str), arguments (tuple): the method and its arguments, as the cache key
+        - items (callable): returns the items of the choices
+    """
+    if not apps.ready:
+        return [(item.value, item.label) for item in items()]
+    key = (cls, get_language(), kind, arguments)
+    try:
+        choices = _choices.get(key)
+    except TypeError:  # unhashable arguments
+        key, choices = None, None
+    if choices is None:
+        choices = [(item.value, str(item.label) if isinstance(item.label, Promise) else item.label) for item in items()]
+        if key is not None:
+            _choices[key] = choices
+    return choices
+
+
+def clear_choices_cache():
+    """ Forget the cached choices of all the enums (eg. when the translations are reloaded). """
+    _choices.clear()
+
+
+@receiver(setting_changed)
+def clear_choices_on_setting_change(setting, **kwargs):
+    if setting in ("LANGUAGES", "LANGUAGE_CODE", "LOCALE_PATHS"):
+        clear_choices_cache()
+
+
+@receiver(file_changed)
+def clear_choices_on_translation_change(file_path, **kwargs):
+    # Like Django's own reset of the translations, when a .mo file changes during development (runserver)
+    if Path(file_path).suffix == ".mo":
+        clear_choices_cache()
+
+
 class FlexUpEnum(EnumProperties):
     """Base class for creating enums with additional properties and methods.
 
@@ -81,91 +247,129 @@ class FlexUpEnum(EnumProperties):
         if property_value and not property_name:
             raise ValueError("property_value cannot be provided without property_name")
 
-        # Extract the raw value if input_value is an enum instance
-        if isinstance(input_value, cls):
+        # Extract the raw value if input_value is an enum instance (of this enum or another one: they hash by name, not by value)
+        if isinstance(input_value, Enum):
             value = input_value.value
         else:
             value = input_value
 
-
-        if short_list:
-            # Handle both enum instances and (value, label) tuples in short_list
-            valid_values_shl = []
-            for item in short_list:
-                if isinstance(item, cls):
-                    valid_values_shl.append(item.value)
-                elif isinstance(item, tuple):
-                    valid_values_shl.append(item[0])  # Get the value from the tuple
-
-        if property_name:
-            if property_value:
-                valid_values_prop = [item.value for item in cls if getattr(item, property_name) == property_value]
-            else:
-                valid_values_prop = [item.value for item in cls if getattr(item, property_name, None) is not None]
-        else:
-            valid_values = [item.value for item in cls]
-
-        # return true if value is in both lists, if applicable
-        if short_list and property_name:
-            return value in valid_values_shl and value in valid_values_prop
-        elif short_list:
-            # print("short_list: ", short_list)
-            # print("value: ", value)
-            # print("valid_values_shl: ", valid_values_shl)
-            return value in valid_values_shl
-        elif property_name:
-            return value in valid_values_prop
-        else:
-            return value in valid_values
+        try:
+            return value in _get_valid_values(cls, short_list, property_name, property_value)
+        except TypeError:
+            return False  # unhashable values are never valid
+
+        # Previous version, replaced by the cached frozensets of _get_valid_values (the lists of valid values were built on each call):
+        # if short_list:
+        #     # Handle both enum instances and (value, label) tuples in short_list
+        #     valid_values_shl = []
+        #     for item in short_list:
+        #         if isinstance(item, cls):
+        #             valid_values_shl.append(item.value)
+        #         elif isinstance(item, tuple):
+        #             valid_values_shl.append(item[0])  # Get the value from the tuple
+        #
+        # if property_name:
+        #     if property_value:
+        #         valid_values_prop = [item.value for item in cls if getattr(item, property_name) == property_value]
+        #     else:
+        #         valid_values_prop = [item.value for item in cls if getattr(item, property_name, None) is not None]
+        # else:
+        #     valid_values = [item.value for item in cls]
+        #
+        # # return true if value is in both lists, if applicable
+        # if short_list and property_name:
+        #     return value in valid_values_shl and value in valid_values_prop
+        # elif short_list:
+        #     # print("short_list: ", short_list)
+        #     # print("value: ", value)
+        #     # print("valid_values_shl: ", valid_values_shl)
+        #     return value in valid_values_shl
+        # elif property_name:
+        #     return value in valid_values_prop
+        # else:
+        #     return value in valid_values
 
     # @classmethod
     @classproperty
     def choices(cls):
-        return [(item.value, item.label) for item in cls]
+        """ The (value, label) tuples of all the items, cached for each language (see _get_choices). """
+        return _get_choices(cls, "choices", (), lambda: cls)
+        # Previous version, replaced by the cached choices of _get_choices (the list was built and the labels translated on each call):
+        # return [(item.value, item.label) for item in cls]
 
     @classmethod
     def allowed_choices(cls, *allowed_values):
         """
-        - Return a filtered list of choices (tuples) based on allowed enum values.
+        - Return a filtered list of choices (tuples) based on allowed enum values, cached for each language (see _get_choices).
         - Args:
             - allowed_values = List of enum instances values to be included in the choices
         - Returns:
             - list of tuples = representing the allowed choices provided
         """
-        return [(item.value, item.label) for item in cls if item.name in allowed_values]
+        return _get_choices(cls, "allowed_choices", allowed_values, lambda: [item for item in cls if item.name in allowed_values])
+        # Previous version, replaced by the cached choices of _get_choices (the list was built and the labels translated on each call):
+        # return [(item.value, item.label) for item in cls if item.name in allowed_values]
 
     @classmethod
     def filter_choices(cls, property_name):
         """
-        - Return a list of choices (tuples) where the given property is not None.
+        - Return a list of choices (tuples) where the given property is not None, cached for each language (see _get_choices).
         - Args:
             - property_name: The name of the property to filter by.
         - Returns:
             - list of tuples representing the enums for the allowed choices provided
         """
-        return [(item.value, item.label) for item in cls if getattr(item, property_name, None) is not None]
+        try:
+            items = _get_property_index(cls, property_name)[_NOT_NONE]
+        except AttributeError:
+            return []
+        return _get_choices(cls, "filter_choices", (property_name,), lambda: items)
+        # Previous version, replaced by the property index and the cached choices of _get_choices (all the items were scanned on each call):
+        # return [(item.value, item.label) for item in cls if getattr(item, property_name, None) is not None]
 
     @classmethod
     def find_by_property(cls, property_name, value):
         """
         Return the list of all enum (tuples) items where the given property has the given value.
+        For a list-valued property (eg. Country.currencies), the items where the list contains the value are also returned.
         - Args:
             - property_name: The name of the property to filter by.
             - value: The value to filter by.
         - Returns:
             - A list of tuples representing the enums where the property has the given value.
         """
-        return [(item.value, item.label) for item in cls if getattr(item, property_name) == value]
+        return [(item.value, item.label) for item in cls.items_by_property(property_name, value)]
+
+    @classmethod
+    def items_by_property(cls, property_name, value):
+        """
+        Return the enum items where the given property has the given value (or contains it, for a list-valued property), like find_by_property.
+        The items are looked up in an index of the property, built on first use (see _get_property_index).
+        - Returns:
+            - A tuple of enum items, in the order of the enum.
+        """
+        index = _get_property_index(cls, property_name)
+        try:
+            return index.get(tuple(value) if isinstance(value, list) else value, ())
+        except TypeError:
+            # Unhashable value (eg. a dict): compare it to each item
+            return tuple(item for item in cls if getattr(item, property_name) == value)
 
     @classmethod
     def get_by_value(cls, value):
         """
         Returns the enum (tuple) item with the given value.
+        The values are looked up in the hash map of the enum, so the cost does not depend on the number of items.
         - Args:
             - value: The value to filter by.
         - Returns:
             - A list of tuples representing the enums with the given value, or None if not found.
         """
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, str):
+            return cls._value2member_map_.get(value)
+        # Other types (eg. an item of another enum) may still be equal to a value: keep the comparison of each item
         return next((item for item in cls if item.value == value), None)
 
     def __str__(self):
@@ -174,18 +378,75 @@ class FlexUpEnum(EnumProperties):
     def __len__(self):
         return len(self.value)
 
-    # the comparison is based on the order of the items in the list
+    @property
+    def ordinal(self):
+        """ Position of the item in the enum (0 for the first one). """
+        return _get_sort_keys(self.__class__)[self._value_]
+
+    @classmethod
+    def sort_keys(cls, property_name=None):
+        """
+        - Return the sort key of each value of the enum, computed once.
+        - Args:
+            - property_name: The property to sort by (eg. "sort_factor" for SystemUnit). The position of the items in the enum if not provided.
+        - Returns:
+            - dict {value: sort key}
+        """
+        return _get_sort_keys(cls, property_name)
+
+    @classmethod
+    def sort_case(cls, field_name, property_name=None, default=None):
+        """
+        - Return a database expression of the sort key of the values of a field, to sort querysets like the enum items.
+        - Example: Product.objects.order_by(SystemUnit.sort_case("system_unit", "sort_factor"), "name")
+        - Args:
+            - field_name: The name (or lookup path) of the FlexUpEnumField.
+            - property_name: The property to sort by. The position of the items in the enum if not provided (see sort_keys).
+            - default: The sort key of the values without a sort key (not in the enum, or whose property is None). If not provided, they are last:
+              after the last position, or after the largest property value if the property is a number or an enum item. For other properties, the default is NULL
+              (sorted first or last depending on the database, eg. first with SQLite).
+        - The property values which are enum items are sorted by their position in their enum, and the lazy texts (eg. label) by their translation.
+        - Returns:
+            - Case expression with one When per sort key (the values with the same sort key are matched with IN).
+        - Raises:
+            - ValidationError: If a property value cannot be compared by the database (see _get_db_sort_key).
+        """
+        sort_keys = _get_sort_keys(cls, property_name)
+        values_by_key = {}
+        for value, key in sort_keys.items():
+            if key is not None:
+                values_by_key.setdefault(_get_db_sort_key(key), []).append(value)
+        if default is None:
+            if property_name is None:
+                default = len(sort_keys)
+            elif values_by_key and all(isinstance(key, (int, float, Decimal)) for key in values_by_key):
+                default = max(values_by_key) + 1
+        output_field = models.IntegerField() if all(isinstance(key, int) for key in values_by_key) else None
+        return models.Case(
+            *(models.When(**{f"{field_name}__in": values}, then=models.Value(key)) for key, values in values_by_key.items()),
+            default=models.Value(default),
+            output_field=output_field,
+        )
+
+    # the comparison is based on the order of the items in the list (precomputed, see sort_keys)
     def __lt__(self, other):
         if self.__class__ is other.__class__:
-            # Get the indices from _member_names_ list
-            # print("same class")
-            self_idx = self.__class__._member_names_.index(self.name)
-            other_idx = self.__class__._member_names_.index(other.name)
-            # print(self_idx, ": ", self.name)
-            # print(other_idx, ": ", other.name)
-            # print(self_idx < other_idx)
-            return self_idx < other_idx
+            ordinals = _get_sort_keys(self.__class__)
+            return ordinals[self._value_] < ordinals[other._value_]
         return self.value < other.value
+
+    # # previous version, replaced by the precomputed ordinals (both names were looked up in _member_names_ on each comparison)
+    # def __lt__(self, other):
+    #     if self.__class__ is other.__class__:
+    #         # Get the indices from _member_names_ list
+    #         # print("same class")
+    #         self_idx = self.__class__._member_names_.index(self.name)
+    #         other_idx = self.__class__._member_names_.index(other.name)
+    #         # print(self_idx, ": ", self.name)
+    #         # print(other_idx, ": ", other.name)
+    #         # print(self_idx < other_idx)
+    #         return self_idx < other_idx
+    #     return self.value < other.value
     
     # # use this version if the the comparison is based on name of the items, but this is redundant with the get_first_item utility function
     # def __lt__(self, other):
@@ -1,31 +1,157 @@
 #  --------- core/models/flexup_enum_field.py
+from enum import Enum
 from typing import Any
-from django.db import models
+from django.core.exceptions import FieldError
+from django.db import migrations, models
+from django.db.models.lookups import In
 from django.forms import ValidationError
 
 
+class EnumPropertyLookup(In):
+    """
+    - Lookup of the items of an enum field by one of their properties, eg. Product.objects.filter(currency__prop_is_active=True).
+    - It compiles to an IN list of the values of the matching items, read from the property index of the enum (see FlexUpEnum.items_by_property).
+    - The properties stored as "True"/"False" strings (eg. Currency.is_active) also match the booleans.
+    - Raises:
+        - FieldError: If the enum of the field has no such property (like the unknown lookups of Django).
+    """
+    property_name = None
+
+    def get_prep_lookup(self):
+        if self.rhs_is_direct_value():
+            self.rhs = [item.value for item in self.get_items(self.lhs.output_field.flexup_enum, self.rhs)]
+        return super().get_prep_lookup()
+
+    def get_items(self, flexup_enum, value):
+        if not all(hasattr(item, self.property_name) for item in flexup_enum):
+            raise FieldError(f"Unsupported lookup '{self.lookup_name}': {flexup_enum.__name__} has no property '{self.property_name}'")
+        items = flexup_enum.items_by_property(self.property_name, value)
+        if not items and isinstance(value, bool):
+            items = flexup_enum.items_by_property(self.property_name, str(value))
+        return items
+
+
+class EnumGroupLookup(EnumPropertyLookup):
+    """
+    - Lookup of the items of an enum field listed by an item of another enum, eg. Product.objects.filter(focus__in_group=FocusGroup.DEFAULT).
+    - The items are read from the first list property of the group holding items of the enum of the field (eg. FocusGroup.focuses).
+    - Raises:
+        - FieldError: If the group has no list of items of the enum of the field.
+    """
+    lookup_name = "in_group"
+
+    def get_items(self, flexup_enum, group):
+        for prop in getattr(group, '_properties_', ()):
+            items = getattr(group, prop.name())
+            if isinstance(items, (list, tuple)) and items and all(isinstance(item, flexup_enum) for item in items):
+                return items
+        raise FieldError(f"Unsupported lookup '{self.lookup_name}': {group!r} has no list of {flexup_enum.__name__} items")
+
+
+_property_lookups = {}  # {lookup name: EnumPropertyLookup subclass}, see get_enum_lookup
+
+
+def get_enum_lookup(lookup_name: str):
+    """ - Return the lookup class of the enum fields for a lookup name: "in_group", or "prop_<property name>" (the classes are created once per property). """
+    if lookup_name == EnumGroupLookup.lookup_name:
+        return EnumGroupLookup
+    if lookup_name.startswith("prop_"):
+        lookup = _property_lookups.get(lookup_name)
+        if lookup is None:
+            lookup = _property_lookups[lookup_name] = type(f"EnumPropertyLookup_{lookup_name[5:]}", (EnumPropertyLookup,), {
+                'lookup_name': lookup_name,
+                'property_name': lookup_name[5:],
+            })
+        return lookup
+    return None
+
+
+def get_enum_choices(flexup_enum, allowed_values=None) -> list:
+    """ - Return the choices of an enum field: all the items of the enum, or only the allowed values (in their order). """
+    if allowed_values is None:
+        return flexup_enum.choices
+    return [(value, flexup_enum._value2member_map_[value].label) for value in allowed_values]
+
+
+def deconstruct_enum_choices(field, kwargs: dict) -> dict:
+    """
+    - Replace the choices of an enum field in its deconstructed kwargs by a reference to the enum, so that the migrations do not inline the items and their labels:
+        - nothing if the choices are all the items of the enum (in the order of the enum),
+        - allowed_values, the list of the values, if the choices are a subset (eg. ProductStatuses).
+    """
+    choices = kwargs.pop('choices', None)
+    if choices:
+        values = [value for value, _label in choices]
+        if values != list(field.flexup_enum._value2member_map_):
+            kwargs['allowed_values'] = values
+    return kwargs
+
+
+def validate_enum_choice(field, value):
+    """
+    - Check that a value (not empty) is one of the choices of an enum field, with a set of the choice values built once per list of choices,
+      instead of comparing the value to each choice like Field.validate (eg. about 170 comparisons for a currency, on each save).
+    - Raises:
+        - ValidationError: If the value is not one of the choices (same error as Field.validate).
+    """
+    choice_values = field.__dict__.get('_choice_values')
+    if choice_values is None or choice_values[0] is not field.choices:
+        choice_values = field._choice_values = (field.choices, frozenset(key for key, _label in field.flatchoices))
+    # The enum items hash by name: look their value up
+    value = value.value if isinstance(value, Enum) else value
+    try:
+        if value in choice_values[1]:
+            return
+    except TypeError:  # unhashable value
+        pass
+    raise ValidationError(field.error_messages["invalid_choice"], code="invalid_choice", params={"value": value})
+
+
 class FlexUpEnumField(models.CharField):
+    """
+    - Field storing the value of a FlexUpEnum item.
+    - The choices are the items of the enum by default, or the allowed values given (or any choices given).
+      The migrations only reference the enum (see deconstruct_enum_choices), so the labels of the items can change without new migrations.
+    """
     description = "A FlexUpEnum field"
 
-    def __init__(self, flexup_enum, *args, **kwargs):
+    def __init__(self, flexup_enum, *args, allowed_values=None, **kwargs):
         self.flexup_enum = flexup_enum
         max_length = max(len(str(item.value)) for item in flexup_enum)
         if 'max_length' in kwargs:
             kwargs.pop('max_length', None)
+        if kwargs.get('choices') is None:
+            kwargs['choices'] = get_enum_choices(flexup_enum, allowed_values)
 
         super().__init__(*args, max_length=max_length, **kwargs)
 
     def deconstruct(self):
         name, path, args, kwargs = super().deconstruct()
         kwargs['flexup_enum'] = self.flexup_enum
+        deconstruct_enum_choices(self, kwargs)
 
         return name, path, args, kwargs
 
+    def validate(self, value, model_instance):
+        # Called by full_clean on each save: check the choices with a set (see validate_enum_choice), then the other checks of Field.validate.
+        # The enum items are never empty: they are not compared to the empty values, which is slow for the symmetric enums
+        if self.editable and self.choices is not None and (isinstance(value, Enum) or value not in self.empty_values):
+            validate_enum_choice(self, value)
+            return
+        super().validate(value, model_instance)
+
+    def get_lookup(self, lookup_name):
+        # Lookups on the properties of the items (eg. currency__prop_is_active=True, focus__in_group=FocusGroup.DEFAULT), see EnumPropertyLookup
+        return get_enum_lookup(lookup_name) or super().get_lookup(lookup_name)
+
     def from_db_value(self, value, expression, connection):
+        # Called for every row: look the value up in the hash map of the enum (the database only returns strings or None)
         if value is not None:
-            for choice in self.flexup_enum:
-                if choice.value == value:
-                    return choice
+            return self.flexup_enum._value2member_map_.get(value)
+            # Previous version, replaced by the hash map lookup above (the items were scanned one by one for every row):
+            # for choice in self.flexup_enum:
+            #     if choice.value == value:
+            #         return choice
 
         return None
 
@@ -65,4 +191,154 @@ class FlexUpEnumField(models.CharField):
 
         raise ValueError(f"Invalid value '{value}' for field {self.name}. Must be one of {[item.value for item in self.flexup_enum]}")
 
-        # return str(value)
\ No newline at end of file
+        # return str(value)
+
+
+SMALL_INTEGER_RANGE = range(-32768, 32768)
+
+
+def get_enum_codes(flexup_enum, codes=None) -> dict:
+    """
+    - Return the integer code of each value of an enum, as stored by FlexUpEnumIntegerField.
+    - Args:
+        - flexup_enum: The enum.
+        - codes: The codes: a dict {value: code}, the name of a property of the enum holding an integer for every item,
+          or None for the position of the items in the enum, starting at 1 (new items must then be added at the end of the enum).
+    - Returns:
+        - dict {value: code}
+    - Raises:
+        - ValidationError: If an item has no code, or the codes are not unique small integers.
+    """
+    if codes is None:
+        codes = {item.value: ordinal for ordinal, item in enumerate(flexup_enum, start=1)}
+    elif isinstance(codes, str):
+        try:
+            codes = {item.value: int(getattr(item, codes)) for item in flexup_enum}
+        except (TypeError, ValueError) as error:
+            raise ValidationError(f"The property {codes} of {flexup_enum.__name__} must be an integer for every item: {error}") from error
+    else:
+        codes = {getattr(value, 'value', value): code for value, code in codes.items()}
+
+    missing = [item.value for item in flexup_enum if item.value not in codes]
+    if missing:
+        raise ValidationError(f"No integer code for {missing} in {flexup_enum.__name__}")
+    if len(set(codes.values())) != len(codes) or any(code not in SMALL_INTEGER_RANGE for code in codes.values()):
+        raise ValidationError(f"The integer codes of {flexup_enum.__name__} must be unique small integers")
+    return codes
+
+
+class FlexUpEnumIntegerField(models.SmallIntegerField):
+    """
+    - FlexUpEnumField stored as a small integer code (2 bytes) instead of the value, for the enum columns of large tables (and their indexes).
+    - The items are read and written like with FlexUpEnumField (enum instances or values), with the same choices; only the database column changes.
+    - The codes must never change once rows are stored: see get_enum_codes for the default codes, and enum_field_to_integer_operations to migrate an existing FlexUpEnumField.
+    """
+    description = "A FlexUpEnum field stored as a small integer"
+
+    def __init__(self, flexup_enum, *args, codes=None, allowed_values=None, **kwargs):
+        self.flexup_enum = flexup_enum
+        self.codes = codes
+        self.code_by_value = get_enum_codes(flexup_enum, codes)
+        self.item_by_code = {code: flexup_enum._value2member_map_[value] for value, code in self.code_by_value.items()}
+        if kwargs.get('choices') is None:
+            kwargs['choices'] = get_enum_choices(flexup_enum, allowed_values)
+        super().__init__(*args, **kwargs)
+
+    @property
+    def validators(self):
+        # The codes are checked by get_enum_codes: skip the range validators of SmallIntegerField, which would compare the enum items to integers
+        return [*self.default_validators, *self._validators]
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['flexup_enum'] = self.flexup_enum
+        deconstruct_enum_choices(self, kwargs)
+        if self.codes is not None:
+            kwargs['codes'] = self.codes
+        return name, path, args, kwargs
+
+    def validate(self, value, model_instance):
+        # Called by full_clean on each save: check the choices with a set (see validate_enum_choice), then the other checks of Field.validate.
+        # The enum items are never empty: they are not compared to the empty values, which is slow for the symmetric enums
+        if self.editable and self.choices is not None and (isinstance(value, Enum) or value not in self.empty_values):
+            validate_enum_choice(self, value)
+            return
+        super().validate(value, model_instance)
+
+    def get_lookup(self, lookup_name):
+        return get_enum_lookup(lookup_name) or super().get_lookup(lookup_name)
+
+    def from_db_value(self, value, expression, connection):
+        if value is not None:
+            return self.item_by_code.get(value)
+        return None
+
+    def to_python(self, value):
+        if isinstance(value, self.flexup_enum) or value is None:
+            return value
+        if isinstance(value, int) and value in self.item_by_code:
+            return self.item_by_code[value]
+        enum_value = self.flexup_enum.get_by_value(value)
+        if enum_value is not None:
+            return enum_value
+        raise ValidationError(f"Invalid value '{value}' for field {self.name}. Must be one of {[item.value for item in self.flexup_enum]}")
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, int) and value in self.item_by_code:
+            return value
+        enum_value = value if isinstance(value, self.flexup_enum) else self.flexup_enum.get_by_value(value)
+        if enum_value is not None:
+            return self.code_by_value[enum_value.value]
+        raise ValueError(f"Invalid value '{value}' for field {self.name}. Must be one of {[item.value for item in self.flexup_enum]}")
+
+    def value_to_string(self, obj):
+        # Serialize the value (eg. in fixtures), not the code
+        value = self.value_from_object(obj)
+        return None if value is None else str(value)
+
+    def formfield(self, **kwargs):
+        # Like FlexUpEnumField: a choice of the values, not a number input
+        return models.Field.formfield(self, **kwargs)
+
+
+def enum_field_to_integer_operations(app_label: str, model_name: str, name: str, field: FlexUpEnumIntegerField) -> list:
+    """
+    - Return the migration operations converting a FlexUpEnumField column to a FlexUpEnumIntegerField, keeping the stored items.
+    - The codes are written in a new column with a single UPDATE, then the old column is dropped and the new one renamed. The operations can be reversed.
+    - Example (in the operations of a migration):
+        *enum_field_to_integer_operations("core", "statuslog", "new_status", FlexUpEnumIntegerField(flexup_enum=Status, choices=Status.choices, blank=True, null=True))
+    - Args:
+        - app_label, model_name: The model of the field.
+        - name: The name of the FlexUpEnumField to convert.
+        - field: The new field (unbound).
+    - Returns:
+        - list of migration operations
+    """
+    code_name = f"{name}_code"
+    name_, path, args, kwargs = field.deconstruct()
+    temporary_field = FlexUpEnumIntegerField(*args, **{**kwargs, 'null': True, 'db_index': False})
+    code_by_value = get_enum_codes(field.flexup_enum, field.codes)
+
+    def copy_codes(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        model._base_manager.update(**{code_name: models.Case(
+            *(models.When(**{name: value}, then=models.Value(code)) for value, code in code_by_value.items()),
+            output_field=models.SmallIntegerField(),
+        )})
+
+    def copy_values(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        model._base_manager.update(**{name: models.Case(
+            *(models.When(**{code_name: code}, then=models.Value(value)) for value, code in code_by_value.items()),
+            output_field=models.CharField(),
+        )})
+
+    return [
+        migrations.AddField(model_name, code_name, temporary_field),
+        migrations.RunPython(copy_codes, copy_values),
+        migrations.RemoveField(model_name, name),
+        migrations.RenameField(model_name, code_name, name),
+        migrations.AlterField(model_name, name, field),
+    ]
@@ -1,7 +1,19 @@
-from django.test import TestCase
-from contract.enums.contract import ContractStatus
+from unittest import skipIf
+from django.db import connection, models
+from django.db.migrations.state import ModelState, ProjectState
+from django.test import TestCase, TransactionTestCase
+from django.utils import translation
+try:
+    from contract.enums.contract import ContractStatus
+except ImportError:  # the contract app is not part of this repository: only test_is_valid_satus needs it
+    ContractStatus = None
+from core.enums.country import Country
+from core.enums.currency import Currency
 from core.enums.status import Status
 from core.models.flexup_enum import FlexUpEnum
+from core.models.flexup_enum_field import FlexUpEnumField, FlexUpEnumIntegerField, enum_field_to_integer_operations
+from django.forms import ValidationError
+from product.enums import Dimension, SystemUnit
 from utils.print_object import _print_object
 
 
@@ -133,12 +145,201 @@ class TestFlexUpEnum(TestCase):
         self.assertFalse(MK.is_valid('H', ShortList3, 'level'))
         self.assertTrue(MK.is_valid('H', ShortList3, 'label'))
 
+    def test_is_valid_cached_values(self):
+        """Test that the cached valid values follow each short list and property filter."""
+        short_list = [(MK.TWO.value, MK.TWO.label)]
+        self.assertTrue(MK.is_valid('T', short_list))
+        self.assertFalse(MK.is_valid('O', short_list))
+        self.assertFalse(MK.is_valid('T', [(MK.ONE.value, MK.ONE.label)]))
+        self.assertTrue(MK.is_valid('O', ShortList1))
+        self.assertFalse(MK.is_valid(['O'], ShortList1))
+        self.assertTrue(Country.is_valid('FR', None, 'currencies', Currency.EUR))
+        self.assertTrue(Country.is_valid('FR', None, 'currencies', [Currency.EUR]))
+        self.assertFalse(Country.is_valid('FR', None, 'currencies', Currency.USD))
+        self.assertTrue(MK.is_valid(Dimension.TIME))  # an item of another enum is compared by value ('T')
+        self.assertTrue(SystemUnit.is_valid('KG', None, 'dimension', Dimension.WEIGHT.value))
+
+    @skipIf(ContractStatus is None, "the contract app is not installed")
     def test_is_valid_satus(self):
         contract_status = Status.NEW
         _print_object(contract_status)
         _print_object(ContractStatus.choices)
         self.assertEqual(Status.is_valid(contract_status), True)
         self.assertEqual(Status.is_valid(contract_status, ContractStatus.choices), True)
+
+    def test_get_by_value(self):
+        """Test the lookup of items by value."""
+        self.assertIs(MK.get_by_value('T'), MK.TWO)
+        self.assertIs(MK.get_by_value(MK.TWO), MK.TWO)
+        self.assertIsNone(MK.get_by_value('X'))
+        self.assertIsNone(MK.get_by_value(None))
+        self.assertIs(Currency.get_by_value('USD'), Currency.USD)
+
+    def test_find_by_list_property(self):
+        """Test finding choices by an element of a list-valued property."""
+        france = (Country.FR.value, Country.FR.label)
+        self.assertIn(france, Country.find_by_property("currencies", Currency.EUR))
+        self.assertIn(france, Country.find_by_property("currencies", "EUR"))
+        self.assertNotIn(france, Country.find_by_property("currencies", Currency.USD))
+        self.assertEqual(Country.find_by_property("calling_codes", "+33"), [france])
+        self.assertIn(france, Country.find_by_property("currencies", [Currency.EUR]))
+        self.assertEqual(MK.find_by_property("symbol", "X"), [])
+        kilogram = (SystemUnit.KG.value, SystemUnit.KG.label)
+        self.assertIn(kilogram, SystemUnit.find_by_property("dimension", SystemUnit.KG.dimension))
+        self.assertIn(kilogram, SystemUnit.find_by_property("dimension", SystemUnit.KG.dimension.value))
+        self.assertEqual([value for value, _label in SystemUnit.find_by_property("dimension", None)], [SystemUnit.AGE_MO.value, SystemUnit.AGE_YR.value])
+        self.assertNotIn((SystemUnit.AGE_MO.value, SystemUnit.AGE_MO.label), SystemUnit.filter_choices("dimension"))
+        with self.assertRaises(AttributeError):
+            MK.find_by_property("colour", "⭐")
+        self.assertEqual(MK.filter_choices("colour"), [])
+
+    def test_choices_cache(self):
+        """Test that the choices are cached for each language, with translated labels, and cleared when the translations change."""
+        choices = Currency.choices
+        self.assertIs(Currency.choices, choices)
+        self.assertIs(type(choices[0][1]), str)
+        self.assertEqual(choices, [(item.value, item.label) for item in Currency])
+        with translation.override('fr'):
+            self.assertIsNot(Currency.choices, choices)
+        self.assertIs(MK.allowed_choices(MK.ONE, MK.TWO), MK.allowed_choices(MK.ONE, MK.TWO))
+        self.assertIs(MK.filter_choices("level"), MK.filter_choices("level"))
+        with self.settings(LANGUAGES=[('en', 'English')]):
+            self.assertIsNot(Currency.choices, choices)
+
+    def test_sort_by_ordinal(self):
+        """Test that the items are sorted by their position in the enum, or by a property."""
+        self.assertEqual([MK.ONE.ordinal, MK.TWO.ordinal, MK.THREE.ordinal], [0, 1, 2])
+        self.assertEqual(sorted([MK.THREE, MK.ONE, MK.TWO]), [MK.ONE, MK.TWO, MK.THREE])
+        self.assertTrue(MK.ONE < MK.TWO)
+        self.assertFalse(MK.THREE < MK.TWO)
+        self.assertEqual(MK.sort_keys("level"), {"O": 1, "T": 2, "H": None})
+        case = MK.sort_case("code", "level")
+        self.assertEqual([(when.condition.children[0][1], when.result.value) for when in case.cases], [(["O"], 1), (["T"], 2)])
+        self.assertEqual(case.default.value, 3)  # THREE has no level: last, after the largest level
+        self.assertEqual(MK.sort_case("code").default.value, 3)
+        case = SystemUnit.sort_case("system_unit", "dimension")  # the dimensions are sorted by their position, the units without dimension last
+        self.assertEqual(case.default.value, len(Dimension))
+        kilogram_key = next(when.result.value for when in case.cases if SystemUnit.KG.value in when.condition.children[0][1])
+        self.assertEqual(kilogram_key, SystemUnit.KG.dimension.ordinal)
+        with self.assertRaises(ValidationError):
+            Country.sort_case("country", "currencies")  # a list cannot be compared by the database
+
+    def test_enum_field_values(self):
+        """Test the conversions of FlexUpEnumField between items and database values."""
+        field = FlexUpEnumField(flexup_enum=Currency, name='currency')
+        self.assertIs(field.from_db_value('JPY', None, None), Currency.JPY)
+        self.assertIsNone(field.from_db_value(None, None, None))
+        self.assertIsNone(field.from_db_value('XXX', None, None))
+        self.assertIs(field.to_python('JPY'), Currency.JPY)
+        self.assertEqual(field.get_prep_value(Currency.JPY), 'JPY')
+        self.assertEqual(field.get_prep_value('JPY'), 'JPY')
+        with self.assertRaises(ValidationError):
+            field.to_python('XXX')
+        with self.assertRaises(ValueError):
+            field.get_prep_value('XXX')
+
+    def test_enum_field_deconstruct(self):
+        """Test that the migrations reference the enum of the fields instead of their choices."""
+        field = FlexUpEnumField(flexup_enum=Currency, choices=Currency.choices, name='currency')
+        kwargs = field.deconstruct()[3]
+        self.assertNotIn('choices', kwargs)
+        self.assertEqual(list(FlexUpEnumField(**kwargs).choices), list(field.choices))
+
+        field = FlexUpEnumField(flexup_enum=Status, choices=Status.allowed_choices(Status.DRAFT, Status.ACTIVE), name='status')
+        kwargs = field.deconstruct()[3]
+        self.assertEqual(kwargs['allowed_values'], [Status.DRAFT.value, Status.ACTIVE.value])
+        self.assertEqual(list(FlexUpEnumField(**kwargs).choices), list(field.choices))
+
+    def test_enum_field_validate(self):
+        """Test the validation of the choices of the enum fields."""
+        field = FlexUpEnumField(flexup_enum=Status, choices=Status.allowed_choices(Status.DRAFT, Status.ACTIVE), name='status')
+        field.validate(Status.DRAFT, None)
+        field.validate('AC', None)
+        for value in (Status.CLOSED, 'XX', ['DR']):
+            with self.assertRaises(ValidationError):
+                field.validate(value, None)
+        with self.assertRaises(ValidationError):
+            field.validate(None, None)  # not null
+        FlexUpEnumField(flexup_enum=Status, null=True, blank=True, name='status').validate(None, None)
+        field.choices = Status.allowed_choices(Status.CLOSED)
+        field.validate(Status.CLOSED, None)
+        with self.assertRaises(ValidationError):
+            field.validate(Status.DRAFT, None)
+        FlexUpEnumIntegerField(flexup_enum=Status, choices=Status.allowed_choices(Status.DRAFT), name='status').validate(Status.DRAFT, None)
+
+    def test_enum_integer_field_values(self):
+        """Test the conversions of FlexUpEnumIntegerField between items and integer codes."""
+        field = FlexUpEnumIntegerField(flexup_enum=MK, name='mock')
+        self.assertEqual(field.get_prep_value(MK.TWO), 2)
+        self.assertEqual(field.get_prep_value('H'), 3)
+        self.assertIs(field.from_db_value(1, None, None), MK.ONE)
+        self.assertIsNone(field.from_db_value(None, None, None))
+        self.assertIs(field.to_python('T'), MK.TWO)
+        self.assertIs(field.to_python(2), MK.TWO)
+        self.assertEqual(field.deconstruct()[3], {'flexup_enum': MK})
+        with self.assertRaises(ValidationError):
+            field.to_python('X')
+        with self.assertRaises(ValueError):
+            field.get_prep_value('X')
+
+        # Codes given by a property, or explicitly
+        with self.assertRaises(ValidationError):
+            FlexUpEnumIntegerField(flexup_enum=MK, codes='level')  # THREE has no level
+        field = FlexUpEnumIntegerField(flexup_enum=Country, codes={country: ordinal for ordinal, country in enumerate(reversed(Country))}, name='country')
+        self.assertEqual(field.get_prep_value(Country.FR), len(Country) - 1 - Country.FR.ordinal)
+        self.assertEqual(FlexUpEnumIntegerField(flexup_enum=MK, codes={MK.ONE: 10, 'T': 20, 'H': 30}).get_prep_value(MK.ONE), 10)
+        with self.assertRaises(ValidationError):
+            FlexUpEnumIntegerField(flexup_enum=MK, codes={'O': 1, 'T': 1, 'H': 2})
+        with self.assertRaises(ValidationError):
+            FlexUpEnumIntegerField(flexup_enum=MK, codes={'O': 1})
+
+
+class TestFlexUpEnumIntegerMigration(TransactionTestCase):
+    """Test the migration of a FlexUpEnumField column to a FlexUpEnumIntegerField (real schema changes, hence outside of a test transaction)."""
+
+    def test_enum_field_to_integer_operations(self):
+        """Test that the stored items are kept by the operations, forwards and backwards."""
+        app_label = "core"
+        state = ProjectState()
+        state.add_model(ModelState(app_label, "EnumSample", [
+            ("id", models.AutoField(primary_key=True)),
+            ("mock", FlexUpEnumField(flexup_enum=MK, null=True)),
+        ]))
+        operations = enum_field_to_integer_operations(app_label, "enumsample", "mock", FlexUpEnumIntegerField(flexup_enum=MK, null=True))
+        states = [state]
+        for operation in operations:
+            states.append(states[-1].clone())
+            operation.state_forwards(app_label, states[-1])
+
+        def read_column():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT mock FROM core_enumsample ORDER BY id")
+                return [row[0] for row in cursor.fetchall()]
+
+        with connection.schema_editor() as editor:
+            editor.create_model(state.apps.get_model(app_label, "EnumSample"))
+        try:
+            # Given rows stored as values
+            state.apps.get_model(app_label, "EnumSample").objects.bulk_create([
+                state.apps.get_model(app_label, "EnumSample")(mock=mock) for mock in (MK.TWO, MK.ONE, None, MK.THREE)
+            ])
+
+            # When the operations are applied, then the items are stored as their codes, and read as the same items
+            with connection.schema_editor() as editor:
+                for operation, from_state, to_state in zip(operations, states, states[1:]):
+                    operation.database_forwards(app_label, editor, from_state, to_state)
+            _print_object({"input": [MK.TWO, MK.ONE, None, MK.THREE], "output": read_column()})
+            self.assertEqual(read_column(), [2, 1, None, 3])
+            self.assertEqual(list(states[-1].apps.get_model(app_label, "EnumSample").objects.order_by("id").values_list("mock", flat=True)), [MK.TWO, MK.ONE, None, MK.THREE])
+
+            # When the operations are reversed, then the items are stored as their values again
+            with connection.schema_editor() as editor:
+                for operation, from_state, to_state in reversed(list(zip(operations, states, states[1:]))):
+                    operation.database_backwards(app_label, editor, to_state, from_state)
+            self.assertEqual(read_column(), ["T", "O", None, "H"])
+        finally:
+            with connection.schema_editor() as editor:
+                editor.delete_model(state.apps.get_model(app_label, "EnumSample"))
         
         
 """ 
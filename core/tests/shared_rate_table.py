@@ -0,0 +1,85 @@
+from datetime import timedelta
+from decimal import Decimal as Dec
+from unittest.mock import patch
+from uuid import uuid4
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.enums.currency import Currency
+from core.models.exchange_rate import ExchangeRate
+from core.utils.convert_currency import get_exchange_rate
+from core.utils.shared_rate_table import SharedRateTable, get_shared_rate_table
+from utils.print_object import _print_object
+
+
+class SharedRateTableTest(TestCase):
+
+    def setUp(self):
+        self.name = f"flexup-test-{uuid4().hex[:8]}"
+        self.table = SharedRateTable.create(self.name)
+        self.now = timezone.now()
+
+    def tearDown(self):
+        self.table.close()
+        self.table.unlink()
+
+    def test_01_unset_rate_returns_none(self):
+        _print_object(print_function_name=True)
+        self.assertIsNone(self.table.get(Currency.USD))
+        self.assertEqual(self.table.version, 0)
+
+    def test_02_rates_are_shared_between_attached_tables(self):
+        # Given a rate written by the refresher
+        _print_object(print_function_name=True)
+        self.table.set_rates({Currency.USD: (Dec("0.950123"), self.now)})
+
+        # Then a worker attached to the same segment reads the same rate
+        worker_table = SharedRateTable.attach(self.name)
+        result = worker_table.get(Currency.USD)
+        worker_table.close()
+
+        _print_object({"input": {"currency": Currency.USD}, "output": result})
+        self.assertEqual(result, Dec("0.950123"))
+        self.assertEqual(self.table.version, 2)  # even: no write in progress
+
+    def test_03_outdated_rate_is_ignored(self):
+        _print_object(print_function_name=True)
+        self.table.set_rates({Currency.JPY: (Dec("0.006100"), self.now - timedelta(hours=25))})
+        self.assertIsNone(self.table.get(Currency.JPY, not_before=self.now - timedelta(hours=24)))
+        self.assertEqual(self.table.get(Currency.JPY), Dec("0.006100"))
+
+    def test_04_refresh_from_database(self):
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.95"))
+        self.assertEqual(self.table.refresh_from_database(), 1)
+        self.assertEqual(self.table.get(Currency.USD), Dec("0.95"))
+
+    @patch("core.utils.convert_currency.fetch_specific_rate_from_api")
+    def test_05_get_exchange_rate_reads_the_shared_table(self, fetch_rate_function):
+        # Given a fresh rate in the shared table, and none in the database
+        _print_object(print_function_name=True)
+        self.table.set_rates({Currency.USD: (Dec("0.91"), self.now)})
+
+        with override_settings(EXCHANGE_RATE_SHARED_MEMORY=self.name):
+            self.assertIsNotNone(get_shared_rate_table())
+            result = get_exchange_rate(Currency.USD)
+
+        # Then the rate is read from memory, without calling the API
+        _print_object({"input": {"currency": Currency.USD}, "output": result})
+        self.assertEqual(result, Dec("0.91"))
+        fetch_rate_function.assert_not_called()
+
+    @patch("core.utils.convert_currency.fetch_specific_rate_from_api")
+    def test_06_get_exchange_rate_falls_back_to_the_api(self, fetch_rate_function):
+        # Given an outdated rate in the shared table
+        _print_object(print_function_name=True)
+        fetch_rate_function.return_value = Dec("0.93")
+        self.table.set_rates({Currency.USD: (Dec("0.91"), self.now - timedelta(days=2))})
+
+        with override_settings(EXCHANGE_RATE_SHARED_MEMORY=self.name):
+            result = get_exchange_rate(Currency.USD)
+
+        # Then the rate is fetched and stored in the database as usual
+        self.assertEqual(result, Dec("0.93"))
+        self.assertEqual(ExchangeRate.objects.get(currency=Currency.USD).rate, Dec("0.93"))
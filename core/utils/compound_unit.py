@@ -0,0 +1,149 @@
+# ------- core/utils/compound_unit.py
+import re
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.forms import ValidationError
+from django.utils.translation import gettext_lazy as _
+
+from core.utils.find_unit import find_system_unit
+from product.enums import SystemUnit
+
+
+class CompoundUnit:
+    """ - Unit made of a product of system units, optionally divided by another product of system units.
+    - Examples: kg·month (price per kg per month), gb·month (price per GB-month), kg/day
+    - Attributes:
+        - numerator (tuple of SystemUnit): the units multiplied together
+        - denominator (tuple of SystemUnit): the units dividing the numerator
+    - Properties:
+        - dimensions (tuple): the dimension vector, ie. the exponent of each dimension, eg. ((Dimension.DURATION, 1), (Dimension.WEIGHT, 1))
+        - units_to_base (Decimal): the exact conversion factor of the unit to the base units of its dimensions
+    - Methods:
+        - of, parse
+    """
+    __slots__ = ('numerator', 'denominator', '_dimensions', '_units_to_base')
+
+    def __init__(self, numerator=(), denominator=()):
+        for unit in (*numerator, *denominator):
+            if not isinstance(unit, SystemUnit) or unit.dimension is None:
+                raise ValidationError(_(f"A compound unit can only be made of system units with a dimension: {unit}."))
+        if not numerator and not denominator:
+            raise ValidationError(_("A compound unit must contain at least one unit."))
+        sort_key = lambda unit: unit.value
+        self.numerator = tuple(sorted(numerator, key=sort_key))
+        self.denominator = tuple(sorted(denominator, key=sort_key))
+
+        exponents = {}
+        units_to_base = Decimal(1)
+        for unit in self.numerator:
+            exponents[unit.dimension] = exponents.get(unit.dimension, 0) + 1
+            units_to_base *= Decimal(str(unit.units_to_base))
+        for unit in self.denominator:
+            exponents[unit.dimension] = exponents.get(unit.dimension, 0) - 1
+            units_to_base /= Decimal(str(unit.units_to_base))
+        self._dimensions = tuple(sorted(((dimension, exponent) for dimension, exponent in exponents.items() if exponent), key=lambda item: item[0].value))
+        self._units_to_base = units_to_base
+
+# Properties
+    @property
+    def dimensions(self) -> tuple:
+        """ Dimension vector: the non-zero exponent of each dimension, sorted by dimension. """
+        return self._dimensions
+
+    @property
+    def units_to_base(self) -> Decimal:
+        """ Exact conversion factor of the unit to the base units of its dimensions. """
+        return self._units_to_base
+
+# Methods
+    @classmethod
+    def of(cls, unit) -> "CompoundUnit":
+        """ - Return the compound unit equivalent to a system unit, a compound unit, or a compound unit expression (see parse).
+        - Raises:
+            - ValidationError: If the unit cannot be converted into a compound unit.
+        """
+        if isinstance(unit, CompoundUnit):
+            return unit
+        if isinstance(unit, SystemUnit):
+            return cls((unit,))
+        if isinstance(unit, str):
+            return cls.parse(unit)
+        raise ValidationError(_(f"Invalid compound unit: {unit}."))
+
+    @classmethod
+    def parse(cls, expression: str) -> "CompoundUnit":
+        """ - Parse a compound unit expression: system unit symbols or values, multiplied with '*' or '·', divided with '/'.
+        - Examples: "kg*month", "gb·month", "kg/day"
+        - Args:
+            - expression (str): The expression to parse.
+        - Returns:
+            - CompoundUnit: The parsed unit.
+        - Raises:
+            - ValidationError: If a unit of the expression is unknown.
+        """
+        numerator, _slash, denominator = expression.partition('/')
+        return cls(
+            tuple(find_system_unit(token) for token in _split_units(numerator)),
+            tuple(find_system_unit(token) for token in _split_units(denominator)),
+        )
+
+# Labels
+    def __eq__(self, other):
+        if isinstance(other, CompoundUnit):
+            return self.numerator == other.numerator and self.denominator == other.denominator
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.numerator, self.denominator))
+
+    def __str__(self):
+        label = "·".join(str(unit.symbol) for unit in self.numerator) or "1"
+        if self.denominator:
+            label += "/" + "·".join(str(unit.symbol) for unit in self.denominator)
+        return label
+
+    def __repr__(self):
+        return f"<CompoundUnit {self}>"
+
+
+def _split_units(expression: str) -> list:
+    return [token.strip() for token in re.split(r"[*·]", expression) if token.strip()]
+
+
+_compound_factors = {}  # {(from_unit, to_unit): Decimal}, see get_compound_factor
+
+
+def get_compound_factor(from_unit, to_unit) -> Decimal:
+    """ - Return the factor to multiply a price per from_unit by, to get the price per to_unit. Each factor is resolved once per pair of units.
+    - Args:
+        - from_unit (CompoundUnit or SystemUnit): The source unit.
+        - to_unit (CompoundUnit or SystemUnit): The target unit.
+    - Returns:
+        - Decimal: The conversion factor.
+    - Raises:
+        - ValidationError: If the units do not have the same dimension vector.
+    """
+    key = (from_unit, to_unit)
+    factor = _compound_factors.get(key)
+    if factor is None:
+        from_compound, to_compound = CompoundUnit.of(from_unit), CompoundUnit.of(to_unit)
+        if from_compound.dimensions != to_compound.dimensions:
+            raise ValidationError(_(f"Cannot convert between units of different dimensions: {from_compound} and {to_compound}."))
+        factor = _compound_factors[key] = to_compound.units_to_base / from_compound.units_to_base
+    return factor
+
+
+def convert_compound_unit(price: Decimal, from_unit, to_unit=None) -> Decimal:
+    """ - Convert a price from one compound unit to another (eg. from EUR per kg per month to EUR per g per day).
+    - Args:
+        - price (Decimal): The price to convert.
+        - from_unit (CompoundUnit or SystemUnit): The source unit.
+        - to_unit (CompoundUnit or SystemUnit, optional): The target unit.
+    - Returns:
+        - Decimal: The converted price (the original price if the target unit is not provided or is the same).
+    - Raises:
+        - ValidationError: If either unit is invalid or the units do not have the same dimension vector.
+    """
+    if not to_unit or from_unit == to_unit:
+        return price
+    return (Decimal(price) * get_compound_factor(from_unit, to_unit)).quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP)
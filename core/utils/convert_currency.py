@@ -1,6 +1,11 @@
 # ------- core/utils/convert_currency.py
+import hashlib
 import requests
+import threading
+from contextlib import contextmanager
 from decimal import Decimal
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.timezone import make_aware,is_naive,datetime
 from django.core.exceptions import ValidationError
@@ -9,10 +14,14 @@ from django.utils.translation import gettext_lazy as _
 from core.enums.currency import Currency
 from datetime import timedelta
 from core.models.exchange_rate import ExchangeRate
+from core.utils.shared_rate_table import get_shared_rate_table
 from decimal import Decimal , ROUND_HALF_UP
 
 from utils.print_object import _print_object
 
+RATE_VALIDITY = timedelta(hours=24)  # a stored rate older than this is fetched again from the API
+STORED_RATES_CACHE_DURATION = timedelta(minutes=5)  # the stored rates cached by get_stored_rate_snapshot are read again after this delay (eg. rates saved by other processes)
+
         
 # Not yet implemented
 def convert_currency(value:Decimal, from_currency: Currency, to_currency: Currency = None, date:datetime=None) -> Decimal:
@@ -51,8 +60,8 @@ def convert_currency(value:Decimal, from_currency: Currency, to_currency: Curren
 
 def get_exchange_rate(currency: Currency, date : datetime = None) -> Decimal:
     
-    """ - Retrieve the exchange rate for a given currency. Fetch from the API if not in the database
-    or if the stored rate is outdated.
+    """ - Retrieve the exchange rate for a given currency. Read it from the shared rate table if one is attached to the process,
+    otherwise from the database. Fetch from the API if not in the database or if the stored rate is outdated.
 
     - Args:
         currency (Currency): The currency for which the rate is required.
@@ -72,10 +81,17 @@ def get_exchange_rate(currency: Currency, date : datetime = None) -> Decimal:
     if date and is_naive(date):
         date = make_aware(date)
 
+    # Try to find the rate in the shared memory table (no database round-trip)
+    shared_table = get_shared_rate_table()
+    if shared_table is not None:
+        shared_rate = shared_table.get(currency, not_before=date - RATE_VALIDITY)
+        if shared_rate is not None:
+            return shared_rate
+
     # Try to find the rate in the database
     try:
         rate_data = ExchangeRate.objects.get(currency=currency)
-        if rate_data.datetime > date - timedelta(hours=24):
+        if rate_data.datetime > date - RATE_VALIDITY:
             # Rate is fresh, return it
             return rate_data.rate
     except ExchangeRate.DoesNotExist:
@@ -87,6 +103,204 @@ def get_exchange_rate(currency: Currency, date : datetime = None) -> Decimal:
     ExchangeRate.objects.update_or_create(currency=currency,defaults={'rate': Decimal(rate),'datetime':date})  # These are the fields to update or create
     return Decimal(rate).quantize(Decimal('0.000001'),rounding=ROUND_HALF_UP)
 
+_stored_rates = threading.local()  # see cache_stored_exchange_rates
+
+
+def get_stored_exchange_rate(currency: Currency) -> Decimal | None:
+    """ - Return the last known exchange rate of a currency, from the shared rate table or the stored rates (see get_stored_rate_snapshot), without fetching it from the API,
+    whatever its age (eg. to compute values that are updated again when the rate is refreshed).
+    - Returns:
+        - Decimal: The exchange rate, or None if the rate has never been stored.
+    """
+    if currency == Currency.EUR:
+        return Decimal(1)  # EUR is the base currency
+    cache = getattr(_stored_rates, 'cache', None)
+    if cache is not None and currency in cache:
+        return cache[currency]
+    rate = None
+    shared_table = get_shared_rate_table()
+    if shared_table is not None:
+        rate = shared_table.get(currency)
+    if rate is None:
+        rate = get_stored_rate_snapshot().rates.get(currency)
+    if cache is not None:
+        cache[currency] = rate
+    return rate
+
+
+@contextmanager
+def cache_stored_exchange_rates():
+    """ - Within this context, get_stored_exchange_rate reads the rate of each currency once (eg. when validating many products in a row).
+    - The cache is local to the thread, and the rates stored meanwhile are not seen until the context exits.
+    """
+    previous_cache = getattr(_stored_rates, 'cache', None)
+    _stored_rates.cache = {} if previous_cache is None else previous_cache
+    try:
+        yield
+    finally:
+        _stored_rates.cache = previous_cache
+
+
+class RateSnapshot:
+    """ - Exchange rates (to EUR) of a set of currencies, resolved once and reused for many conversions.
+    - Attributes:
+        - rates (dict): {Currency: Decimal} rate of each currency of the snapshot (EUR is implicit)
+        - valid_until (datetime): date after which the oldest rate of the snapshot is outdated
+        - id (str): short digest of the rates, identifying the snapshot (eg. in price quotes)
+    - Methods:
+        - get_rate, is_valid, convert
+    """
+    __slots__ = ('rates', 'valid_until', 'id')
+
+    def __init__(self, rates: dict, valid_until: datetime):
+        self.rates = rates
+        self.valid_until = valid_until
+        digest = hashlib.sha1(";".join(f"{currency.value}={rate}" for currency, rate in sorted(rates.items(), key=lambda item: item[0].value)).encode())
+        self.id = digest.hexdigest()[:12]
+
+    def get_rate(self, currency: Currency) -> Decimal:
+        """ - Return the rate of a currency of the snapshot.
+        - Raises:
+            - ValidationError: If the currency is not part of the snapshot.
+        """
+        if currency == Currency.EUR:
+            return Decimal(1)
+        try:
+            return self.rates[currency]
+        except KeyError:
+            raise ValidationError(_(f"The currency {currency} is not part of the rate snapshot."))
+
+    def is_valid(self, date: datetime = None) -> bool:
+        """ Return True if none of the rates is outdated at the given date (now by default). """
+        return (date or timezone.now()) < self.valid_until
+
+    def convert(self, value: Decimal, from_currency: Currency, to_currency: Currency = None) -> Decimal:
+        """ Same as convert_currency, using the rates of the snapshot. """
+        if not from_currency:
+            raise ValidationError(_('The source currency must be provided.'))
+        if not to_currency or from_currency == to_currency:
+            return Decimal(value)
+        if not isinstance(from_currency, Currency) or not isinstance(to_currency, Currency):
+            raise ValidationError(_('One or both provided currencies are invalid.'))
+        return Decimal((Decimal(value) * self.get_rate(from_currency)) / self.get_rate(to_currency)).quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP)
+
+    def __repr__(self):
+        return f"<RateSnapshot {self.id}: {len(self.rates)} rates valid until {self.valid_until:%Y-%m-%d %H:%M}>"
+
+
+_stored_rate_snapshot = None  # (RateSnapshot, expiry datetime), see get_stored_rate_snapshot
+
+
+def get_stored_rate_snapshot() -> RateSnapshot:
+    """ - Return the last stored exchange rate of every currency, read with a single query and cached for the process
+    (eg. to compute the normalized price of each product saved, without a query on each save).
+    - The cache is cleared when a rate is saved or deleted by this process, and read again after STORED_RATES_CACHE_DURATION (rates saved by other processes).
+    - Returns:
+        - RateSnapshot: The stored rates, whatever their age (the currencies without any stored rate are not part of the snapshot).
+    """
+    global _stored_rate_snapshot
+    now = timezone.now()
+    if _stored_rate_snapshot is None or _stored_rate_snapshot[1] <= now:
+        rates = {}
+        valid_until = now + RATE_VALIDITY
+        for currency, rate, rate_datetime in ExchangeRate.objects.order_by('-datetime', '-pk').values_list('currency', 'rate', 'datetime'):
+            if currency not in rates:
+                rates[currency] = rate
+                valid_until = min(valid_until, rate_datetime + RATE_VALIDITY)
+        _stored_rate_snapshot = (RateSnapshot(rates, valid_until), now + STORED_RATES_CACHE_DURATION)
+    return _stored_rate_snapshot[0]
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def clear_stored_rate_snapshot(**kwargs):
+    """ Forget the stored rates cached by get_stored_rate_snapshot (eg. when a rate is saved). """
+    global _stored_rate_snapshot
+    _stored_rate_snapshot = None
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def clear_currency_conversion_plans(instance, **kwargs):
+    """ Forget the conversion plans compiled with the rates of the currency (see compile_conversion), whichever app saved or deleted the rate. """
+    from core.utils.convert_price import clear_conversion_plans  # imported here: convert_price imports this module
+    clear_conversion_plans(instance.currency)
+
+
+def get_rate_snapshot(currencies, date: datetime = None) -> RateSnapshot:
+    """ - Resolve the exchange rates of several currencies at once.
+    - The stored rates are read with a single query. Missing or outdated rates are fetched and stored by get_exchange_rate.
+    - Args:
+        - currencies: The currencies (iterable of Currency) to include in the snapshot.
+        - date: The date to use for the conversion rates. If None, the current date is used.
+    - Returns:
+        - RateSnapshot: The rates of the currencies.
+    - Raises:
+        - ValidationError: If any currency is invalid.
+        - RuntimeError: If a rate cannot be fetched from the API.
+    """
+    if not date:
+        date = timezone.now()
+    if is_naive(date):
+        date = make_aware(date)
+
+    currencies = set(currencies) - {Currency.EUR, None}
+    if any(not isinstance(currency, Currency) for currency in currencies):
+        raise ValidationError(_('One or more provided currencies are invalid.'))
+
+    rates = {}
+    valid_until = date + RATE_VALIDITY
+    for rate_data in ExchangeRate.objects.filter(currency__in=currencies):
+        if rate_data.datetime > date - RATE_VALIDITY:
+            rates[rate_data.currency] = rate_data.rate
+            valid_until = min(valid_until, rate_data.datetime + RATE_VALIDITY)
+    for currency in currencies - rates.keys():
+        rates[currency] = get_exchange_rate(currency, date)  # fetched from the API and stored in the database
+    return RateSnapshot(rates, valid_until)
+
+
+_active_currencies = None  # see get_active_currencies
+
+
+def get_active_currencies() -> tuple:
+    """ Return the active currencies (is_active), in the order of the Currency enum. """
+    global _active_currencies
+    if _active_currencies is None:
+        _active_currencies = tuple(currency for currency in Currency if currency.is_active == 'True')
+    return _active_currencies
+
+
+def convert_currency_to_many(value: Decimal, from_currency: Currency, to_currencies=None, date: datetime = None) -> dict:
+    """ - Convert a value into several currencies at once (eg. to show a price in many currencies), with a single rate snapshot.
+    - Each converted value is the same as convert_currency(value, from_currency, to_currency), but the rates are resolved with one query
+      and the value is converted to EUR only once.
+    - Args:
+        - value: The value to convert.
+        - from_currency: The currency to convert from.
+        - to_currencies: The currencies to convert to (iterable of Currency). All the active currencies if not provided.
+        - date: The date to use for the conversion rates. If None, the current date is used.
+    - Returns:
+        - dict: {Currency: Decimal} the converted value in each currency, in the order of to_currencies.
+    - Raises:
+        - ValidationError: If the source currency is not provided.
+        - ValidationError: If any provided currency is invalid.
+    """
+    if not from_currency:
+        raise ValidationError(_('The source currency must be provided.'))
+    to_currencies = get_active_currencies() if to_currencies is None else tuple(to_currencies)
+    if not isinstance(from_currency, Currency) or any(not isinstance(currency, Currency) for currency in to_currencies):
+        raise ValidationError(_('One or more provided currencies are invalid.'))
+
+    rate_snapshot = get_rate_snapshot((from_currency, *to_currencies), date)
+    value = Decimal(value)
+    value_in_eur = value * rate_snapshot.get_rate(from_currency)
+    quantum = Decimal('0.0001')
+    return {
+        currency: value if currency == from_currency else (value_in_eur / rate_snapshot.get_rate(currency)).quantize(quantum, rounding=ROUND_HALF_UP)
+        for currency in to_currencies
+    }
+
+
 def fetch_specific_rate_from_api(currency: Currency,date : datetime = None) -> Decimal:
     """ - Fetch the exchange rate for a specific currency from an external API
                 with base EUR.
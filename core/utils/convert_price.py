@@ -1,8 +1,11 @@
 from decimal import ROUND_HALF_UP, Decimal
 
 from django.forms import ValidationError
+from django.utils.translation import gettext_lazy as _
 
 from core.utils import convert_currency, convert_unit
+from core.utils.convert_currency import RateSnapshot, get_rate_snapshot
+from core.utils.convert_unit import PRICE_QUANTUM, resolve_unit_factor
 from product.enums import SystemUnit
 from core.enums.currency import Currency
 
@@ -30,3 +33,156 @@ def convert_price(price: Decimal, from_currency:Currency, to_currency:Currency=N
     
     return price_in_target_unit    
 
+
+class ConversionPlan:
+    """ - Reusable conversion of prices along one route (currencies and units), see compile_conversion.
+    - Attributes:
+        - from_currency, to_currency (Currency): the currencies of the route (to_currency is never None)
+        - from_unit, to_unit (SystemUnit or str): the units of the route (to_unit is None if the unit is kept)
+        - factor (Decimal): the currency and unit factors multiplied together
+        - rate_snapshot (RateSnapshot): the exchange rates the factor was computed with
+    - Methods:
+        - convert, is_valid
+    """
+    __slots__ = ('from_currency', 'to_currency', 'from_unit', 'to_unit', 'factor', 'rate_snapshot')
+
+    def __init__(self, from_currency: Currency, to_currency: Currency, from_unit, to_unit, rate_snapshot: RateSnapshot):
+        if not from_currency:
+            raise ValidationError(_('The source currency must be provided.'))
+        to_currency = to_currency or from_currency
+        if not isinstance(from_currency, Currency) or not isinstance(to_currency, Currency):
+            raise ValidationError(_('One or both provided currencies are invalid.'))
+        unit_factor = resolve_unit_factor(from_unit, to_unit)
+
+        self.from_currency = from_currency
+        self.to_currency = to_currency
+        self.from_unit = from_unit
+        self.to_unit = to_unit
+        self.rate_snapshot = rate_snapshot
+        self.factor = rate_snapshot.get_rate(from_currency) / rate_snapshot.get_rate(to_currency)
+        if unit_factor is not None:
+            self.factor *= unit_factor
+
+    def convert(self, price: Decimal) -> Decimal:
+        """ - Convert a price along the route, with a single multiplication and a single rounding.
+        - Args:
+            - price (Decimal): The price in from_currency per from_unit.
+        - Returns:
+            - Decimal: The price in to_currency per to_unit, with 4 decimals.
+        """
+        return (Decimal(price) * self.factor).quantize(PRICE_QUANTUM, rounding=ROUND_HALF_UP)
+
+    def is_valid(self, date=None) -> bool:
+        """ Return True if the exchange rates of the plan are not outdated. """
+        return self.rate_snapshot.is_valid(date)
+
+    def __repr__(self):
+        return f"<ConversionPlan {self.from_currency}/{self.from_unit} → {self.to_currency}/{self.to_unit} x {self.factor}>"
+
+
+_conversion_plans = {}  # compiled plans, by route (see compile_conversion)
+
+
+def compile_conversion(from_currency: Currency, to_currency: Currency = None, from_unit: SystemUnit = None, to_unit: SystemUnit = None, rate_snapshot: RateSnapshot = None) -> ConversionPlan:
+    """ - Return a reusable plan to convert prices from one currency and unit to another.
+    - The validation, the exchange rates and the unit factor are resolved once, so each conversion costs one multiplication and one rounding
+      (unlike convert_price, which rounds after the currency conversion and again after the unit conversion).
+    - Plans using the current rates are cached by route, and compiled again once their exchange rates are outdated.
+    - Args:
+        - from_currency (Currency): The source currency.
+        - to_currency (Currency, optional): The target currency (the source currency if not provided).
+        - from_unit (SystemUnit or str, optional): The source unit.
+        - to_unit (SystemUnit or str, optional): The target unit (the source unit if not provided).
+        - rate_snapshot (RateSnapshot, optional): The rates to use (the plan is then not cached). If not provided, the current rates of both currencies are resolved.
+    - Returns:
+        - ConversionPlan: The compiled plan.
+    - Raises:
+        - ValidationError: If the source currency is not provided, if either currency is invalid, or if the units cannot be converted.
+    """
+    if rate_snapshot is not None:
+        return ConversionPlan(from_currency, to_currency, from_unit, to_unit, rate_snapshot)
+
+    route = (from_currency, to_currency, from_unit, to_unit)
+    plan = _conversion_plans.get(route)
+    if plan is not None and plan.is_valid():
+        return plan
+
+    if not from_currency:
+        raise ValidationError(_('The source currency must be provided.'))
+    rate_snapshot = get_rate_snapshot([from_currency, to_currency or from_currency])
+    plan = _conversion_plans[route] = ConversionPlan(from_currency, to_currency, from_unit, to_unit, rate_snapshot)
+    return plan
+
+
+def clear_conversion_plans(currency: Currency = None):
+    """ - Forget the compiled plans (eg. when an exchange rate changes).
+    - Args:
+        - currency (Currency, optional): Only forget the plans converting from or to this currency.
+    """
+    if currency is None:
+        _conversion_plans.clear()
+        return
+    for route, plan in list(_conversion_plans.items()):
+        if currency in (plan.from_currency, plan.to_currency):
+            del _conversion_plans[route]
+
+
+class PriceQuote:
+    """ - Immutable result of a price conversion, not stored in the database (see quote_price).
+    - Attributes:
+        - price (Decimal): the converted price
+        - currency (Currency): the currency of the price
+        - unit (SystemUnit or str): the unit of the price (None if the price has no unit)
+        - rate_snapshot_id (str): the id of the exchange rates the price was converted with
+    """
+    __slots__ = ('price', 'currency', 'unit', 'rate_snapshot_id')
+
+    def __init__(self, price: Decimal, currency: Currency, unit, rate_snapshot_id: str):
+        object.__setattr__(self, 'price', price)
+        object.__setattr__(self, 'currency', currency)
+        object.__setattr__(self, 'unit', unit)
+        object.__setattr__(self, 'rate_snapshot_id', rate_snapshot_id)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __eq__(self, other):
+        if isinstance(other, PriceQuote):
+            return (self.price, self.currency, self.unit, self.rate_snapshot_id) == (other.price, other.currency, other.unit, other.rate_snapshot_id)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.price, self.currency, self.unit, self.rate_snapshot_id))
+
+    def __str__(self):
+        unit = getattr(self.unit, 'symbol', self.unit)
+        return f"{self.price} {self.currency.symbol}/{unit}" if unit else f"{self.price} {self.currency.symbol}"
+
+    def __repr__(self):
+        return f"<PriceQuote {self} (rates {self.rate_snapshot_id})>"
+
+
+def quote_price(price: Decimal, from_currency: Currency, to_currency: Currency = None, from_unit: SystemUnit = None, to_unit: SystemUnit = None) -> PriceQuote:
+    """ - Convert a price like convert_price (same rounding), and return it with its currency, unit and exchange rates, without writing anything.
+    - Args:
+        - price (Decimal): The price to convert.
+        - from_currency (Currency): The source currency.
+        - to_currency (Currency, optional): The target currency (the source currency if not provided).
+        - from_unit (SystemUnit or str, optional): The source unit.
+        - to_unit (SystemUnit or str, optional): The target unit (the source unit if not provided).
+    - Returns:
+        - PriceQuote: The converted price.
+    - Raises:
+        - ValidationError: If the source currency is not provided, if either currency is invalid, or if the units cannot be converted.
+    """
+    if not from_currency:
+        raise ValidationError(_('The source currency must be provided.'))
+    to_currency = to_currency or from_currency
+    # The rates are only resolved if the currency changes
+    rate_snapshot = get_rate_snapshot([from_currency, to_currency] if from_currency != to_currency else [])
+    price_in_target_currency = rate_snapshot.convert(price, from_currency, to_currency)
+    price_in_target_unit = convert_unit(price_in_target_currency, from_unit, to_unit)
+    return PriceQuote(price_in_target_unit, to_currency, to_unit or from_unit, rate_snapshot.id)
@@ -1,21 +1,85 @@
-# ------- core/utils/convert_currency.py
- 
+
 from decimal import ROUND_HALF_UP, Decimal
 from gettext import gettext as _
 
 from django.forms import ValidationError
+from core.utils.compound_unit import CompoundUnit, convert_compound_unit, get_compound_factor
 from product.enums import SystemUnit
 
-# Not yet implemented
-    
+
+def _build_unit_factors():
+    """ - Precompute the conversion factor of every pair of system units of the same dimension.
+    - The factors are built from the decimal literals of `units_to_base` (str), not from the binary floats, so that they are exact.
+    - Returns:
+        - dict: {(from_unit value, to_unit value): Decimal} factor to multiply a price per from_unit by, to get the price per to_unit
+          (keyed by the values because they hash much faster than the enum instances)
+        - dict: {unit: tuple of units} the units each unit can be converted to (including itself)
+    """
+    units_by_dimension = {}
+    for unit in SystemUnit:
+        units_by_dimension.setdefault(unit.dimension, []).append(unit)
+
+    unit_factors = {}
+    convertible_units = {}
+    for units in units_by_dimension.values():
+        for from_unit in units:
+            for to_unit in units:
+                unit_factors[(from_unit.value, to_unit.value)] = Decimal(str(to_unit.units_to_base)) / Decimal(str(from_unit.units_to_base))
+            convertible_units[from_unit] = tuple(units)
+    return unit_factors, convertible_units
+
+
+UNIT_FACTORS, CONVERTIBLE_UNITS = _build_unit_factors()
+BASE_UNIT_FACTORS = {unit.value: Decimal(1) / Decimal(str(unit.units_to_base)) for unit in SystemUnit if unit.dimension is not None}
+PRICE_QUANTUM = Decimal('0.0001')  # prices have 4 decimals
+
+
+def get_convertible_units(unit: SystemUnit) -> tuple:
+    """ - Return the system units a price per unit can be converted to.
+    - Args:
+        - unit (SystemUnit): The source unit.
+    - Returns:
+        - tuple of SystemUnit: The units of the same dimension (including the unit itself), or an empty tuple for a custom unit.
+    """
+    return CONVERTIBLE_UNITS.get(unit, ()) if isinstance(unit, SystemUnit) else ()
+
+
+def get_unit_factor(from_unit: SystemUnit, to_unit: SystemUnit) -> Decimal:
+    """ - Return the factor to multiply a price per from_unit by, to get the price per to_unit.
+    - Args:
+        - from_unit (SystemUnit): The source unit.
+        - to_unit (SystemUnit): The target unit.
+    - Returns:
+        - Decimal: The exact conversion factor.
+    - Raises:
+        - ValidationError: If either unit is not a system unit, or the units have different dimensions.
+    """
+    if not isinstance(from_unit, SystemUnit) or not isinstance(to_unit, SystemUnit):
+        raise ValidationError(_(f"Cannot convert between custom units or between system and custom units: {from_unit} and {to_unit}."))
+    factor = UNIT_FACTORS.get((from_unit._value_, to_unit._value_))
+    if factor is None:
+        raise ValidationError(_(f"Cannot convert between units of different dimensions: {from_unit} and {to_unit}."))
+    return factor
+
+
+def get_base_unit_factor(unit: SystemUnit) -> Decimal | None:
+    """ - Return the factor to multiply a price per unit by, to get the price per base unit of its dimension (eg. per kg for a weight).
+    - Args:
+        - unit (SystemUnit): The unit.
+    - Returns:
+        - Decimal: The exact conversion factor, or None for a custom unit or a system unit without dimension.
+    """
+    return BASE_UNIT_FACTORS.get(unit._value_) if isinstance(unit, SystemUnit) else None
+
+
 def convert_unit(price: Decimal, from_unit, to_unit=None) -> Decimal:
     """
     Convert a price from one unit to another.
-    
+
     Args:
         price: The price to convert.
-        from_unit: The source unit (can be a system or custom unit).
-        to_unit: The target unit (can be a system or custom unit).
+        from_unit: The source unit (can be a system, compound or custom unit).
+        to_unit: The target unit (can be a system, compound or custom unit).
 
     Returns:
         The converted price.
@@ -23,19 +87,97 @@ def convert_unit(price: Decimal, from_unit, to_unit=None) -> Decimal:
     Raises:
         ValidationError: If either unit is invalid or conversion is not possible.
     """
+    if isinstance(to_unit, SystemUnit) and isinstance(from_unit, SystemUnit):
+        # Return the original price if units are the same (enum instances are singletons)
+        if from_unit is to_unit:
+            return price
+
+        # The pair is only in the table if both units are of the same dimension
+        factor = UNIT_FACTORS.get((from_unit._value_, to_unit._value_))
+        if factor is None:
+            raise ValidationError(_(f"Cannot convert between units of different dimensions: {from_unit} and {to_unit}."))
+
+        # Convert price to target unit
+        return (Decimal(price) * factor).quantize(PRICE_QUANTUM, rounding=ROUND_HALF_UP)
+
     # Return the original price if units are the same or target unit is not provided
     if from_unit == to_unit or not to_unit:
         return price
 
-    if isinstance(from_unit, SystemUnit) and isinstance(to_unit, SystemUnit):
-        # Check if both units are of the same dimension
-        if from_unit.dimension != to_unit.dimension:
-            raise ValidationError(_(f"Cannot convert between units of different dimensions: {from_unit} and {to_unit}."))
-        
-        # Convert price to target unit
-        converted_price = (Decimal(price) * Decimal(to_unit.units_to_base)) / Decimal(from_unit.units_to_base)
-        return Decimal(converted_price.quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP))
+    # Compound units (eg. kg·month) are only checked here, to keep the system units path above as fast as possible
+    if isinstance(from_unit, CompoundUnit) or isinstance(to_unit, CompoundUnit):
+        return convert_compound_unit(price, from_unit, to_unit)
 
+    # Previous version, replaced by the precomputed exact factors of UNIT_FACTORS (the factors were computed from the binary floats on each call):
+    # # Return the original price if units are the same or target unit is not provided
+    # if from_unit == to_unit or not to_unit:
+    #     return price
+    #
+    # if isinstance(from_unit, SystemUnit) and isinstance(to_unit, SystemUnit):
+    #     # Check if both units are of the same dimension
+    #     if from_unit.dimension != to_unit.dimension:
+    #         raise ValidationError(_(f"Cannot convert between units of different dimensions: {from_unit} and {to_unit}."))
+    #
+    #     # Convert price to target unit
+    #     converted_price = (Decimal(price) * Decimal(to_unit.units_to_base)) / Decimal(from_unit.units_to_base)
+    #     return Decimal(converted_price.quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP))
 
     # Handle custom units (we assume conversion is not possible)
     raise ValidationError(_(f"Cannot convert between custom units or between system and custom units: {from_unit} and {to_unit}."))
+
+
+def resolve_unit_factor(from_unit, to_unit) -> Decimal | None:
+    """ - Apply the rules of convert_unit to a pair of units, without converting any price.
+    - Returns:
+        - Decimal: The conversion factor, or None if convert_unit returns the price unchanged.
+    - Raises:
+        - ValidationError: If the units cannot be converted.
+    """
+    if isinstance(to_unit, SystemUnit) and isinstance(from_unit, SystemUnit):
+        return None if from_unit is to_unit else get_unit_factor(from_unit, to_unit)
+    if from_unit == to_unit or not to_unit:
+        return None
+    if isinstance(from_unit, CompoundUnit) or isinstance(to_unit, CompoundUnit):
+        return get_compound_factor(from_unit, to_unit)
+    raise ValidationError(_(f"Cannot convert between custom units or between system and custom units: {from_unit} and {to_unit}."))
+
+
+def convert_unit_batch(prices, from_units, to_units=None) -> list:
+    """ - Convert many prices from one unit to another at once, with the same results as calling convert_unit on each price.
+    - The units are validated in bulk: each distinct (from_unit, to_unit) pair is checked once, before any price is converted.
+    - Args:
+        - prices: The prices to convert (sequence of Decimal).
+        - from_units: The source unit of each price (sequence of the same length), or a single unit for all the prices.
+        - to_units: The target unit of each price (sequence of the same length), or a single unit for all the prices.
+    - Returns:
+        - list of Decimal: The converted prices, in the same order.
+    - Raises:
+        - ValidationError: If the sequences have different lengths, or if any pair of units cannot be converted (all the invalid pairs are listed).
+    """
+    count = len(prices)
+    if to_units is None or isinstance(to_units, (SystemUnit, CompoundUnit, str)):
+        to_units = [to_units] * count
+    if from_units is None or isinstance(from_units, (SystemUnit, CompoundUnit, str)):
+        from_units = [from_units] * count
+    if len(from_units) != count or len(to_units) != count:
+        raise ValidationError(_("The prices, source units and target units must have the same length."))
+
+    # Resolve each distinct pair once. Pairs are keyed by identity (enum instances are singletons), which is much faster than hashing them
+    factors = {}
+    invalid_pairs = []
+    for from_unit, to_unit in zip(from_units, to_units):
+        key = (id(from_unit), id(to_unit))
+        if key not in factors:
+            try:
+                factors[key] = resolve_unit_factor(from_unit, to_unit)
+            except ValidationError:
+                factors[key] = None
+                invalid_pairs.append(f"{from_unit} → {to_unit}")
+    if invalid_pairs:
+        raise ValidationError(_(f"Cannot convert between these units: {', '.join(invalid_pairs)}."))
+
+    converted_prices = []
+    for price, from_unit, to_unit in zip(prices, from_units, to_units):
+        factor = factors[(id(from_unit), id(to_unit))]
+        converted_prices.append(price if factor is None else (Decimal(price) * factor).quantize(PRICE_QUANTUM, rounding=ROUND_HALF_UP))
+    return converted_prices
@@ -0,0 +1,34 @@
+# ------- core/utils/find_unit.py
+from django.forms import ValidationError
+from django.utils import translation
+from django.utils.translation import gettext_lazy as _
+
+from product.enums import SystemUnit
+
+
+_units_by_symbol = None  # {symbol or value: SystemUnit}, see find_system_unit
+
+
+def _get_units_by_symbol() -> dict:
+    """ - Return the system units by lowercase symbol and by value, built on first use (the symbols are lazy translations: they cannot be evaluated on import).
+    - Concurrent first calls may build the index twice: both results are identical.
+    """
+    global _units_by_symbol
+    if _units_by_symbol is None:
+        with translation.override(None):  # the untranslated symbols, whatever the active language
+            units_by_symbol = {str(unit.symbol).lower(): unit for unit in SystemUnit}
+        units_by_symbol.update({unit.value: unit for unit in SystemUnit})
+        _units_by_symbol = units_by_symbol
+    return _units_by_symbol
+
+
+def find_system_unit(text: str) -> SystemUnit:
+    """ - Return the system unit with the given symbol (case-insensitive, eg. "kg", "fl-oz-us", not translated) or value (eg. "KG", "FLU").
+    - Raises:
+        - ValidationError: If no system unit matches.
+    """
+    units_by_symbol = _get_units_by_symbol()
+    unit = units_by_symbol.get(text) or units_by_symbol.get(text.lower())
+    if unit is None:
+        raise ValidationError(_(f"Unknown unit: {text}."))
+    return unit
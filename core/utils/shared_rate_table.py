@@ -0,0 +1,174 @@
+# ------- core/utils/shared_rate_table.py
+import struct
+import time
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from multiprocessing import resource_tracker, shared_memory
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from core.enums.currency import Currency
+from core.models.exchange_rate import ExchangeRate
+
+
+class SharedRateTable:
+    """ - Table of exchange rates (to EUR) stored in shared memory, so that all the pre-forked workers of a server read the same rates.
+    - A single refresher process writes the table (see the `refresh_shared_rates` command), the workers only read it, without any lock.
+    - Layout:
+        - header: version counter (uint64), odd while the refresher is writing, even when the table is stable
+        - one slot per Currency (in declaration order): rate in millionths (int64) and timestamp of the rate (float64, 0 if not set)
+    - Readers use the version counter as a seqlock: they copy the slot, and retry if the version was odd or has changed meanwhile.
+    - Methods:
+        - create, attach, close, unlink
+        - get, set_rates, refresh_from_database
+    """
+    HEADER = struct.Struct("<Q")
+    SLOT = struct.Struct("<qd")
+    RATE_SCALE = 1_000_000   # exchange rates are stored with 6 decimals (see ExchangeRate.rate)
+    MAX_READ_ATTEMPTS = 100
+
+    _slot_indexes = {currency: index for index, currency in enumerate(Currency)}
+    SIZE = HEADER.size + SLOT.size * len(_slot_indexes)
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self._shm = shm
+        self._buf = shm.buf
+
+# Methods
+    @classmethod
+    def create(cls, name: str) -> "SharedRateTable":
+        """ - Create the shared memory segment of the table (refresher side). All the rates are initially unset.
+        - Args:
+            - name (str): The name of the shared memory segment.
+        - Returns:
+            - SharedRateTable: The new table.
+        - Raises:
+            - FileExistsError: If a segment with this name already exists.
+        """
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.SIZE)
+        # The segment must outlive a restart of the refresher: it is only destroyed by an explicit unlink
+        resource_tracker.unregister(shm._name, "shared_memory")
+        shm.buf[:cls.SIZE] = bytes(cls.SIZE)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedRateTable":
+        """ - Attach to an existing table (worker side).
+        - Args:
+            - name (str): The name of the shared memory segment.
+        - Returns:
+            - SharedRateTable: The attached table.
+        - Raises:
+            - FileNotFoundError: If the refresher has not created the segment yet.
+        """
+        shm = shared_memory.SharedMemory(name=name, create=False)
+        # Only the refresher owns the segment: do not let the resource tracker destroy it when a worker exits
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm)
+
+    def close(self):
+        """ Detach the table from the current process. """
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        """ Destroy the shared memory segment (refresher side, once all the workers are stopped). """
+        resource_tracker.register(self._shm._name, "shared_memory")  # SharedMemory.unlink unregisters it again
+        self._shm.unlink()
+
+    @property
+    def version(self) -> int:
+        """ Current value of the version counter (odd while a write is in progress). """
+        return self.HEADER.unpack_from(self._buf, 0)[0]
+
+    def get(self, currency: Currency, not_before: datetime = None) -> Decimal | None:
+        """ - Read the rate of a currency, without any lock.
+        - Args:
+            - currency (Currency): The currency to read.
+            - not_before (datetime, optional): Ignore the rate if it is older than this date.
+        - Returns:
+            - Decimal: The exchange rate, or None if the rate is not set, is outdated, or the currency is unknown.
+        """
+        index = self._slot_indexes.get(currency)
+        if index is None:
+            return None
+        offset = self.HEADER.size + index * self.SLOT.size
+        for _ in range(self.MAX_READ_ATTEMPTS):
+            version = self.HEADER.unpack_from(self._buf, 0)[0]
+            if version & 1:
+                continue  # write in progress
+            scaled_rate, timestamp = self.SLOT.unpack_from(self._buf, offset)
+            if self.HEADER.unpack_from(self._buf, 0)[0] == version:
+                break
+        else:
+            return None  # the table keeps changing, let the caller use the database instead
+        if not timestamp or (not_before is not None and timestamp <= not_before.timestamp()):
+            return None
+        return Decimal(scaled_rate).scaleb(-6)
+
+    def set_rates(self, rates: dict):
+        """ - Write several rates at once (refresher side only: the seqlock supports a single writer).
+        - Args:
+            - rates (dict): {Currency: (rate: Decimal, datetime: datetime)}
+        """
+        version = self.version
+        self.HEADER.pack_into(self._buf, 0, version + 1)
+        try:
+            for currency, (rate, rate_datetime) in rates.items():
+                offset = self.HEADER.size + self._slot_indexes[currency] * self.SLOT.size
+                self.SLOT.pack_into(self._buf, offset, int((Decimal(rate) * self.RATE_SCALE).to_integral_value(rounding=ROUND_HALF_UP)), rate_datetime.timestamp())
+        finally:
+            self.HEADER.pack_into(self._buf, 0, version + 2)
+
+    def refresh_from_database(self) -> int:
+        """ - Copy all the exchange rates stored in the database into the table.
+        - Returns:
+            - int: The number of rates written.
+        """
+        rates = {row.currency: (row.rate, row.datetime) for row in ExchangeRate.objects.all()}
+        if rates:
+            self.set_rates(rates)
+        return len(rates)
+
+
+# Table attached to the current (worker) process, see get_shared_rate_table
+_attached_table = None
+_next_attach_attempt = 0.0
+ATTACH_RETRY_SECONDS = 60
+
+
+def get_shared_rate_table() -> SharedRateTable | None:
+    """ - Return the shared rate table of the current process, attaching to it on first use.
+    - The table is optional: it is only used if the EXCHANGE_RATE_SHARED_MEMORY setting contains the name of the segment.
+    - Returns:
+        - SharedRateTable: The attached table, or None if it is disabled or the refresher has not created it yet.
+    """
+    global _attached_table, _next_attach_attempt
+    if _attached_table is not None:
+        return _attached_table
+    name = getattr(settings, "EXCHANGE_RATE_SHARED_MEMORY", None)
+    if not name or time.monotonic() < _next_attach_attempt:
+        return None
+    try:
+        _attached_table = SharedRateTable.attach(name)
+    except FileNotFoundError:
+        _next_attach_attempt = time.monotonic() + ATTACH_RETRY_SECONDS  # refresher not started yet, try again later
+    return _attached_table
+
+
+def detach_shared_rate_table():
+    """ Detach the current process from the shared rate table. """
+    global _attached_table, _next_attach_attempt
+    if _attached_table is not None:
+        _attached_table.close()
+    _attached_table = None
+    _next_attach_attempt = 0.0
+
+
+@receiver(setting_changed)
+def _detach_on_setting_changed(setting, **kwargs):
+    """ Re-attach to the right segment when the setting is overridden (eg. in tests). """
+    if setting == "EXCHANGE_RATE_SHARED_MEMORY":
+        detach_shared_rate_table()
@@ -0,0 +1,292 @@
+# ------- product/conversion.py
+# Conversion of the prices of many products at once, referenced by the methods of the models of product/models.py.
+# The models are not imported here (product/models.py imports this module): they are read from the querysets.
+from decimal import Decimal as Dec, ROUND_HALF_UP
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Round
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from core.enums.currency import Currency
+from core.models.exchange_rate import ExchangeRate
+from core.utils.convert_currency import RateSnapshot, get_rate_snapshot
+from core.utils.convert_unit import BASE_UNIT_FACTORS, PRICE_QUANTUM, get_convertible_units, get_unit_factor, resolve_unit_factor
+from product.enums import SystemUnit
+
+NORMALIZED_PRICE_QUANTUM = Dec('1E-16')  # see Product.normalized_price
+NORMALIZED_PRICE_MAX_DIGITS = 42  # 26 integer digits: largest price (11 integer digits) x largest exchange rate (9 integer digits) x largest unit factor (1E+6, eg. a price per mg)
+
+
+def convert_products(products, to_currency: Currency = None, to_unit: SystemUnit = None, batch_size: int = 1000, rate_snapshot: RateSnapshot = None) -> int:
+    """ - Convert the price of all the products of a queryset, with the same results as Product.convert_price(persist=True) on each product.
+    - The routes (currency and unit of the products) are validated and the exchange rates resolved once, before any product is created.
+      The new products are then written with bulk_create, in batches (without calling save, hence without full_clean on each product).
+    - Products without a price excluding tax are skipped.
+
+    - Args:
+        products (ProductQuerySet): The products to convert.
+        to_currency (Currency): The target currency for conversion.
+        to_unit (SystemUnit): The target unit for conversion.
+        batch_size (int): The number of products read and created at once.
+        rate_snapshot (RateSnapshot, optional): The exchange rates to use (eg. shared by several conversions). If not provided, the current rates are resolved.
+
+    - Returns:
+        int: The number of products created.
+
+    - Raises:
+        ValidationError: If the target currency and target unit are none
+        ValidationError: If the price of any product cannot be converted (all the invalid routes are listed)
+    """
+    if not to_currency and not to_unit:
+        raise ValidationError(_("You must specify either a target currency or a target unit for price conversion."))
+
+    Product = products.model
+    products = products.exclude(price_excluding_tax=None).exclude(price_excluding_tax=0)
+    routes = set(products.order_by().values_list('currency', 'system_unit', 'custom_unit').distinct())
+
+    # Resolve the unit factor of each route once (the currency is converted with the snapshot, like convert_currency)
+    unit_factors = {}
+    invalid_routes = []
+    for currency, system_unit, custom_unit in routes:
+        from_unit = system_unit or custom_unit
+        try:
+            if not currency:
+                raise ValidationError(_('The source currency must be provided.'))
+            unit_factors[(system_unit, custom_unit)] = resolve_unit_factor(from_unit, to_unit)
+        except ValidationError:
+            invalid_routes.append(f"{currency}/{from_unit} → {to_currency or currency}/{to_unit or from_unit}")
+    if invalid_routes:
+        raise ValidationError(_(f"Cannot convert the price of the products: {', '.join(invalid_routes)}."))
+    if rate_snapshot is None:
+        rate_snapshot = get_rate_snapshot({currency for currency, _system_unit, _custom_unit in routes} | {to_currency})
+
+    # The products are read while the new products are created in the same table: stop at the last existing product,
+    # as the chunked reads see the rows inserted by the same connection (eg. with SQLite)
+    max_pk = products.aggregate(max_pk=models.Max('pk'))['max_pk']
+    if max_pk is None:
+        return 0
+
+    count = 0
+    new_products = []
+    with transaction.atomic():
+        for product in products.filter(pk__lte=max_pk).non_polymorphic().iterator(chunk_size=batch_size):
+            new_price = rate_snapshot.convert(product.price_excluding_tax, product.currency, to_currency)
+            unit_factor = unit_factors[(product.system_unit, product.custom_unit)]
+            if unit_factor is not None:
+                new_price = (new_price * unit_factor).quantize(PRICE_QUANTUM, rounding=ROUND_HALF_UP)
+            new_unit = to_unit or product.system_unit
+            new_product = Product(
+                name=product.name,
+                currency=to_currency or product.currency,
+                price_excluding_tax=new_price,
+                tax_rate=product.tax_rate,
+                description=product.description,
+                system_unit=new_unit if isinstance(new_unit, SystemUnit) else None,
+                custom_unit=None if isinstance(new_unit, SystemUnit) else new_unit,
+                status=product.status,
+                visibility=product.visibility,
+                focus=product.focus,
+            )
+            new_product.normalized_price = new_product.get_normalized_price(rate_snapshot.get_rate(new_product.currency))
+            new_product.pre_save_polymorphic()
+            new_products.append(new_product)
+            if len(new_products) >= batch_size:
+                count += len(Product.objects.bulk_create(new_products))
+                new_products = []
+        if new_products:
+            count += len(Product.objects.bulk_create(new_products))
+    return count
+
+
+def annotate_converted_price(products, to_currency: Currency, to_unit: SystemUnit = None, name: str = 'converted_price'):
+    """ - Annotate each product with its price excluding tax converted to a currency (and optionally a system unit), computed by the database.
+    - The converted price can then be used to sort and filter, eg. .with_converted_price(Currency.USD).filter(converted_price__lte=100).order_by('converted_price')
+    - The rate of each product's currency is read with a subquery on ExchangeRate (the rates of the currencies of the queryset are first
+      refreshed if missing or outdated), and the unit factor with a CASE on the system unit. The target rate is folded into the unit factors,
+      so the database only multiplies.
+    - The converted price is NULL for products without a price, or whose unit cannot be converted to the target unit.
+
+    - Args:
+        products (ProductQuerySet): The products to annotate.
+        to_currency (Currency): The target currency.
+        to_unit (SystemUnit, optional): The target unit (the unit of each product is kept if not provided).
+        name (str): The name of the annotation.
+
+    - Returns:
+        ProductQuerySet: The annotated queryset.
+
+    - Raises:
+        ValidationError: If the target currency or unit is invalid.
+    """
+    if not isinstance(to_currency, Currency):
+        raise ValidationError(_('The target currency is invalid.'))
+    if to_unit is not None and not isinstance(to_unit, SystemUnit):
+        raise ValidationError(_('The target unit must be a system unit.'))
+
+    currencies = set(products.order_by().values_list('currency', flat=True).distinct())
+    to_rate = get_rate_snapshot(currencies | {to_currency}).get_rate(to_currency)
+
+    decimal_field = DecimalField(max_digits=30, decimal_places=10)
+    from_rate = Case(
+        When(currency=Currency.EUR, then=Value(Dec(1))),
+        default=Subquery(ExchangeRate.objects.filter(currency=OuterRef('currency')).order_by('-datetime').values('rate')[:1]),
+        output_field=decimal_field,
+    )
+    if to_unit is None:
+        factor = Value(1 / to_rate, output_field=decimal_field)
+    else:
+        factor = Case(
+            *[When(system_unit=unit, then=Value(get_unit_factor(unit, to_unit) / to_rate)) for unit in get_convertible_units(to_unit)],
+            default=None,
+            output_field=decimal_field,
+        )
+    converted_price = Round(models.F('price_excluding_tax') * from_rate * factor, 4, output_field=DecimalField(max_digits=30, decimal_places=4))
+    return products.annotate(**{name: converted_price})
+
+
+def aggregate_converted_price(products, to_currency: Currency, *group_by: str, aggregate=models.Sum, to_unit: SystemUnit = None):
+    """ - Aggregate the prices converted to a currency (see with_converted_price) in the database, optionally grouped by some fields,
+    eg. the sum of the prices of the active products in USD by focus: .filter(status=Status.ACTIVE).aggregate_converted_price(Currency.USD, 'focus')
+    - Products whose price cannot be converted (see with_converted_price) are ignored.
+
+    - Args:
+        products (ProductQuerySet): The products to aggregate.
+        to_currency (Currency): The target currency.
+        group_by (str): The fields to group the products by.
+        aggregate: The aggregate function (Sum by default, or Avg, Min, Max...).
+        to_unit (SystemUnit, optional): The target unit (to aggregate prices per unit, eg. the average price per kg).
+
+    - Returns:
+        Decimal: The aggregated price, if the products are not grouped (None if there is no price to aggregate).
+        dict: The aggregated price of each group {value: price}, or {(value, value...): price} if grouped by several fields.
+    """
+    products = annotate_converted_price(products.order_by(), to_currency, to_unit)
+    if not group_by:
+        return products.aggregate(total=aggregate('converted_price'))['total']
+    rows = products.values(*group_by).annotate(total=aggregate('converted_price')).order_by(*group_by)
+    if len(group_by) == 1:
+        return {row[group_by[0]]: row['total'] for row in rows}
+    return {tuple(row[field] for field in group_by): row['total'] for row in rows}
+
+
+def get_normalized_price_expression(rate: Dec):
+    """ - Return the database expression of the normalized price (see Product.get_normalized_price) of the products of a currency.
+    - The expression only uses the fields of the products, so it is also used by the migrations, with the historical models.
+    - Args:
+        - rate (Decimal): The exchange rate of the currency of the products.
+    """
+    factor = Case(
+        *[When(system_unit=unit, then=Value(rate * unit_factor)) for unit, unit_factor in BASE_UNIT_FACTORS.items()],
+        default=None,
+        output_field=DecimalField(max_digits=NORMALIZED_PRICE_MAX_DIGITS, decimal_places=16),
+    )
+    return Round(models.F('price_excluding_tax') * factor, 16)
+
+
+def refresh_normalized_price(products, rates: dict) -> int:
+    """ - Compute again the normalized price of the products, with one UPDATE per currency.
+
+    - Args:
+        products (ProductQuerySet): The products to update.
+        rates (dict): The exchange rate of each currency to update {Currency: Decimal, or None if the rate is unknown}.
+          The products in the other currencies are not updated.
+
+    - Returns:
+        int: The number of products updated.
+    """
+    count = 0
+    for currency, rate in rates.items():
+        currency_products = products.filter(currency=currency)
+        if rate is None:
+            count += currency_products.update(normalized_price=None)
+        else:
+            count += currency_products.update(normalized_price=get_normalized_price_expression(rate))
+    return count
+
+
+def run_repricing_task(task, products, chunk_size: int = 1000, max_chunks: int = None) -> int:
+    """ - Reprice the products of a RepricingTask after its watermark, chunk by chunk (one transaction per chunk).
+
+    - Args:
+        task (RepricingTask): The task, whose watermark (last_pk) and completion are saved with each chunk.
+        products (ProductQuerySet): The products of the currency of the task.
+        chunk_size (int): The number of products repriced in each chunk.
+        max_chunks (int, optional): Stop after this number of chunks, leaving the task pending.
+
+    - Returns:
+        int: The number of products repriced.
+    """
+    products = products.order_by('pk')
+    count = 0
+    chunks = 0
+    while not task.completed_datetime and (max_chunks is None or chunks < max_chunks):
+        pks = list(products.filter(pk__gt=task.last_pk).values_list('pk', flat=True)[:chunk_size])
+        with transaction.atomic():
+            if pks:
+                count += refresh_normalized_price(products.filter(pk__gt=task.last_pk, pk__lte=pks[-1]), {task.currency: task.rate})
+                task.last_pk = pks[-1]
+            if len(pks) < chunk_size:
+                task.completed_datetime = timezone.now()
+            task.save(update_fields=['last_pk', 'completed_datetime'])
+        chunks += 1
+    return count
+
+
+def start_conversion_run(run_model, products, to_currency: Currency = None, to_unit: SystemUnit = None, shard_size: int = 10000):
+    """ - Create a ConversionRun converting all the products, with the current exchange rates of their currencies.
+
+    - Args:
+        run_model (type): The ConversionRun model.
+        products (ProductQuerySet): All the products.
+        to_currency (Currency, optional): The target currency.
+        to_unit (SystemUnit, optional): The target unit.
+        shard_size (int): The number of primary keys of each shard.
+
+    - Returns:
+        ConversionRun: The new run.
+
+    - Raises:
+        ValidationError: If the target currency and target unit are none, or if a rate cannot be resolved.
+    """
+    if not to_currency and not to_unit:
+        raise ValidationError(_("You must specify either a target currency or a target unit for price conversion."))
+    products = products.non_polymorphic().order_by()
+    rate_snapshot = get_rate_snapshot(set(products.values_list('currency', flat=True).distinct()) | {to_currency})
+    return run_model.objects.create(
+        to_currency=to_currency,
+        to_unit=to_unit,
+        rates={currency.value: str(rate) for currency, rate in rate_snapshot.rates.items()},
+        valid_until=rate_snapshot.valid_until,
+        max_pk=products.aggregate(max_pk=models.Max('pk'))['max_pk'] or 0,
+        shard_size=shard_size,
+    )
+
+
+def convert_shard(run, products, first_pk: int, last_pk: int, batch_size: int = 1000) -> int:
+    """ - Convert the products of a shard of a ConversionRun, and record the shard as converted in the same transaction.
+    - The products are converted route by route (currency and unit): the products whose price cannot be converted (eg. a custom unit
+      to a system unit) are skipped and counted in the shard, so that the shard is still converted (and not failed again on resume).
+
+    - Args:
+        run (ConversionRun): The run, whose rates are used.
+        products (ProductQuerySet): The products of the shard.
+        first_pk (int), last_pk (int): The range of primary keys of the shard.
+        batch_size (int): The number of products read and created at once.
+
+    - Returns:
+        int: The number of products created.
+    """
+    rate_snapshot = run.rate_snapshot
+    with transaction.atomic():
+        count, skipped = 0, 0
+        for currency, system_unit, custom_unit in set(products.order_by().values_list('currency', 'system_unit', 'custom_unit').distinct()):
+            route_products = products.filter(currency=currency, system_unit=system_unit, custom_unit=custom_unit)
+            try:
+                count += convert_products(route_products, run.to_currency, run.to_unit, batch_size=batch_size, rate_snapshot=rate_snapshot)
+            except ValidationError:
+                skipped += route_products.exclude(price_excluding_tax=None).exclude(price_excluding_tax=0).count()
+        run.shards.create(first_pk=first_pk, last_pk=last_pk, count=count, skipped=skipped)
+    return count
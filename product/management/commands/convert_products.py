@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Sum
+
+from core.enums.currency import Currency
+from product.enums import SystemUnit
+from product.models import ConversionRun
+
+
+def get_default_workers() -> int:
+    """ One worker process per CPU, or a single one with SQLite without IMMEDIATE transactions (concurrent writers fail with "database is locked"). """
+    connection = connections["default"]
+    if connection.vendor == "sqlite" and str(connection.settings_dict["OPTIONS"].get("transaction_mode", "")).upper() != "IMMEDIATE":
+        return 1
+    return os.cpu_count() or 1
+
+
+def convert_shard(run_pk: int, first_pk: int, last_pk: int, batch_size: int) -> int:
+    """ Convert one shard of a run, in a worker process. """
+    return ConversionRun.objects.get(pk=run_pk).convert_shard(first_pk, last_pk, batch_size)
+
+
+class Command(BaseCommand):
+    help = "Convert the price of all the products into a currency and unit, in parallel by primary key range. A failed run can be resumed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--currency", default=None, help="Currency code of the converted products (eg. USD)")
+        parser.add_argument("--unit", default=None, help="System unit code of the converted products (eg. KG)")
+        parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (1 converts in this process). Default: one per CPU, or 1 with SQLite without IMMEDIATE transactions")
+        parser.add_argument("--shard-size", type=int, default=10000, help="Number of primary keys of each shard")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of products read and created at once")
+        parser.add_argument("--resume", type=int, default=None, metavar="RUN_ID", help="Resume a failed run, skipping its converted shards")
+
+    def handle(self, *args, **options):
+        if options["resume"]:
+            try:
+                run = ConversionRun.objects.get(pk=options["resume"])
+            except ConversionRun.DoesNotExist:
+                raise CommandError(f"Unknown conversion run: {options['resume']}")
+        else:
+            try:
+                to_currency = Currency(options["currency"].upper()) if options["currency"] else None
+                to_unit = SystemUnit(options["unit"].upper()) if options["unit"] else None
+                run = ConversionRun.start(to_currency, to_unit, options["shard_size"])
+            except (ValueError, ValidationError) as e:
+                raise CommandError(e)
+
+        workers = options["workers"] or get_default_workers()
+        shards = run.get_pending_shards()
+        self.stdout.write(f"Conversion run #{run.pk}: {len(shards)} shards to convert")
+        count, failures = 0, 0
+        if workers <= 1:
+            for first_pk, last_pk in shards:
+                count += run.convert_shard(first_pk, last_pk, options["batch_size"])
+        else:
+            connections.close_all()  # the workers open their own connections
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as executor:
+                futures = {executor.submit(convert_shard, run.pk, first_pk, last_pk, options["batch_size"]): (first_pk, last_pk) for first_pk, last_pk in shards}
+                for future in as_completed(futures):
+                    try:
+                        count += future.result()
+                    except Exception as e:
+                        failures += 1
+                        self.stderr.write(f"Shard {futures[future]} failed: {e}")
+
+        run.complete()
+        self.stdout.write(f"{count} products created")
+        skipped = run.shards.aggregate(skipped=Sum("skipped"))["skipped"]
+        if skipped:
+            self.stderr.write(f"{skipped} products skipped (their price cannot be converted)")
+        if failures:
+            raise CommandError(f"{failures} shards failed, resume with --resume {run.pk}")
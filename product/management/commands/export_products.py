@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.enums.currency import Currency
+from product.enums import SystemUnit
+from product.utils import export_products, write_products_csv, write_products_jsonl
+
+
+class Command(BaseCommand):
+    help = "Stream the product catalog as CSV or JSON Lines, with the prices converted into the requested currencies."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=["csv", "jsonl"], default="csv", help="Output format")
+        parser.add_argument("--currency", action="append", default=[], help="Currency code to convert the prices into (repeatable)")
+        parser.add_argument("--unit", default=None, help="System unit code of the converted prices (eg. KG), written in the price_unit column")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Number of products read from the database at once")
+        parser.add_argument("--output", default=None, help="File to write (default: standard output)")
+
+    def handle(self, *args, **options):
+        try:
+            currencies = [Currency(code.upper()) for code in options["currency"]]
+            to_unit = SystemUnit(options["unit"].upper()) if options["unit"] else None
+        except ValueError as e:
+            raise CommandError(e)
+
+        rows = export_products(currencies=currencies, to_unit=to_unit, chunk_size=options["chunk_size"])
+        stream = open(options["output"], "w", newline="", encoding="utf-8") if options["output"] else self.stdout
+        try:
+            if options["format"] == "csv":
+                count = write_products_csv(rows, stream, currencies)
+            else:
+                count = write_products_jsonl(rows, stream)
+        finally:
+            if options["output"]:
+                stream.close()
+        if options["output"]:
+            self.stdout.write(f"{count} products exported to {options['output']}")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from product.utils import import_products, read_product_rows
+
+
+class Command(BaseCommand):
+    help = "Import products from a CSV file (with a header line) or a JSON Lines file, validating each row and creating the products in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import")
+        parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="File format (default: from the file extension)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of products created at once")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"] or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+        try:
+            with open(path, newline="", encoding="utf-8") as stream:
+                count, errors = import_products(read_product_rows(stream, format), options["batch_size"])
+        except OSError as e:
+            raise CommandError(e)
+
+        for line_number, message in errors:
+            self.stderr.write(f"Line {line_number}: {message}")
+        self.stdout.write(f"{count} products imported, {len(errors)} rows rejected")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from product.models import RepricingTask
+
+
+class Command(BaseCommand):
+    help = "Run the pending repricing tasks (products whose prices derived from an exchange rate were not all updated after the rate changed), eg. periodically."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Number of products repriced in each transaction")
+
+    def handle(self, *args, **options):
+        tasks = RepricingTask.objects.filter(completed_datetime=None).count()
+        count = RepricingTask.resume_pending(options["chunk_size"])
+        self.stdout.write(f"{count} products repriced by {tasks} pending tasks")
@@ -23,15 +23,15 @@ class Migration(migrations.Migration):
             fields=[
                 ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
                 ('name', models.CharField(max_length=255, verbose_name='Product name')),
-                ('currency', core.models.flexup_enum_field.FlexUpEnumField(blank=True, choices=[('AFN', 'Afghani'), ('DZD', 'Algerian Dinar'), ('ARS', 'Argentine peso'), ('AMD', 'Armenian Dram'), ('AWG', 'Aruban florin'), ('AUD', 'Australian dollar'), ('AZN', 'Azerbaijan Manat'), ('BSD', 'Bahamian dollar'), ('BHD', 'Bahraini Dinar'), ('THB', 'Baht'), ('PAB', 'Balboa'), ('BBD', 'Barbados Dollar'), ('BYN', 'Belarusian ruble'), ('BZD', 'Belize Dollar'), ('BMD', 'Bermudian dollar'), ('BOB', 'Boliviano'), ('BRL', 'Brazilian real'), ('BND', 'Brunei dollar'), ('BGN', 'Bulgarian lev'), ('BIF', 'Burundi Franc'), ('CVE', 'Cabo Verde Escudo'), ('CAD', 'Canadian dollar'), ('KYD', 'Cayman Islands Dollar'), ('XOF', 'CFA Franc BCEAO'), ('XAF', 'CFA Franc BEAC'), ('XPF', 'CFP Franc'), ('CLP', 'Chilean peso'), ('CNY', 'Chinese Yuan'), ('COP', 'Colombian peso'), ('KMF', 'Comorian Franc'), ('CDF', 'Congolese franc'), ('BAM', 'Convertible Mark'), ('NIO', 'Cordoba Oro'), ('CRC', 'Costa Rican Colon'), ('HRK', 'Croatia Kuna'), ('CUP', 'Cuban peso'), ('CZK', 'Czech koruna'), ('GMD', 'Dalasi'), ('DKK', 'Danish krone'), ('MKD', 'Denar'), ('DJF', 'Djibouti Franc'), ('STN', 'Dobra'), ('DOP', 'Dominican peso'), ('VND', 'Dong'), ('XCD', 'East Caribbean Dollar'), ('EGP', 'Egyptian pound'), ('SVC', 'El Salvador Colon'), ('ETB', 'Ethiopian Birr'), ('EUR', 'Euro'), ('FKP', 'Falkland Islands pound'), ('FJD', 'Fiji Dollar'), ('SLL', 'First Leone'), ('HUF', 'Forint'), ('GHS', 'Ghana Cedi'), ('GIP', 'Gibraltar Pound'), ('HTG', 'Gourde'), ('PYG', 'Guarani'), ('GGP', 'Guernsey Pound'), ('GNF', 'Guinean Franc'), ('GYD', 'Guyana Dollar'), ('HKD', 'Hong Kong Dollar'), ('UAH', 'Hryvnia'), ('ISK', 'Iceland Krona'), ('INR', 'Indian rupee'), ('IRR', 'Iranian rial'), ('IQD', 'Iraqi Dinar'), ('IMP', 'Isle of Man Pound'), ('JMD', 'Jamaican dollar'), ('JEP', 'Jersey Pound'), ('JOD', 'Jordanian Dinar'), ('KES', 'Kenyan Shilling'), ('PGK', 'Kina'), ('KWD', 'Kuwaiti Dinar'), ('AOA', 'Kwanza'), ('MMK', 'Kyat'), ('LAK', 'Lao kip'), ('GEL', 'Lari'), ('LBP', 'Lebanese pound'), ('ALL', 'Lek'), ('HNL', 'Lempira'), ('LRD', 'Liberian dollar'), ('LYD', 'Libyan Dinar'), ('SZL', 'Lilangeni'), ('LSL', 'Loti'), ('MGA', 'Malagasy Ariary'), ('MWK', 'Malawi Kwacha'), ('MYR', 'Malaysian ringgit'), ('MUR', 'Mauritius Rupee'), ('MXN', 'Mexican peso'), ('MDL', 'Moldovan Leu'), ('MAD', 'Moroccan Dirham'), ('MZN', 'Mozambique Metical'), ('BOV', 'Mvdol'), ('NGN', 'Naira'), ('ERN', 'Nakfa'), ('NAD', 'Namibia Dollar'), ('NPR', 'Nepalese rupee'), ('ANG', 'Netherlands Antillean guilder'), ('ILS', 'New Israeli Sheqel'), ('TWD', 'New Taiwan dollar'), ('NZD', 'New Zealand Dollar'), ('BTN', 'Ngultrum'), ('KPW', 'North Korean won'), ('NOK', 'Norwegian krone'), ('MRU', 'Ouguiya'), ('TOP', 'Pa`anga'), ('PKR', 'Pakistan Rupee'), ('MOP', 'Pataca'), ('UYU', 'Peso Uruguayo'), ('PHP', 'Philippine peso'), ('PLN', 'Polish Złoty'), ('GBP', 'Pound Sterling'), ('BWP', 'Pula'), ('QAR', 'Qatari Rial'), ('GTQ', 'Quetzal'), ('ZAR', 'Rand'), ('OMR', 'Rial Omani'), ('KHR', 'Riel'), ('RON', 'Romanian leu'), ('MVR', 'Rufiyaa'), ('IDR', 'Rupiah'), ('RUB', 'Russian ruble'), ('RWF', 'Rwanda Franc'), ('SHP', 'Saint Helena Pound'), ('SAR', 'Saudi riyal'), ('SLE', 'Second Leone'), ('RSD', 'Serbian dinar'), ('SCR', 'Seychelles Rupee'), ('SGD', 'Singapore Dollar'), ('PEN', 'Sol'), ('SBD', 'Solomon Islands Dollar'), ('KGS', 'Som'), ('SOS', 'Somali shilling'), ('TJS', 'Somoni'), ('SSP', 'South Sudanese Pound'), ('LKR', 'Sri Lanka Rupee'), ('SDG', 'Sudanese Pound'), ('SRD', 'Surinam Dollar'), ('SEK', 'Swedish krona'), ('CHF', 'Swiss franc'), ('SYP', 'Syrian pound'), ('BDT', 'Taka'), ('WST', 'Tala'), ('TZS', 'Tanzanian Shilling'), ('KZT', 'Tenge'), ('TTD', 'Trinidad and Tobago Dollar'), ('MNT', 'Tugrik'), ('TND', 'Tunisian Dinar'), ('TRY', 'Turkish lira'), ('TMT', 'Turkmenistan New Manat'), ('TVD', 'Tuvalu Dollar'), ('AED', 'UAE Dirham'), ('UGX', 'Uganda Shilling'), ('USD', 'US Dollar'), ('UZS', 'Uzbekistan Sum'), ('VUV', 'Vatu'), ('VED', 'Venezuela Bolívar Digital'), ('VEF', 'Venezuela Bolívar Fuerte'), ('VES', 'Venezuela Bolívar Soberano'), ('KRW', 'Won'), ('YER', 'Yemeni rial'), ('JPY', 'Yen'), ('ZMW', 'Zambian Kwacha'), ('ZWL', 'Zimbabwe Dollar')], flexup_enum=core.enums.currency.Currency, max_length=3, null=True, verbose_name='Currency')),
+                ('currency', core.models.flexup_enum_field.FlexUpEnumField(blank=True, flexup_enum=core.enums.currency.Currency, max_length=3, null=True, verbose_name='Currency')),
                 ('price_excluding_tax', models.DecimalField(blank=True, decimal_places=4, max_digits=15, null=True, verbose_name='Price excluding tax')),
                 ('tax_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='Tax rate')),
                 ('description', models.TextField(blank=True, null=True, verbose_name='Description')),
-                ('system_unit', core.models.flexup_enum_field.FlexUpEnumField(blank=True, choices=[('BAR', 'Barrel'), ('BIT', 'Binary digit'), ('BIS', 'Bits per second'), ('BYT', 'Byte'), ('CL', 'Centiliter'), ('CM', 'Centimeter'), ('DAY', 'Day'), ('DL', 'Deciliter'), ('DOZ', 'Dozen'), ('FLK', 'Fluid ounce (uk)'), ('FLU', 'Fluid ounce (us)'), ('FT', 'Foot'), ('FT2', 'Square foot'), ('FT3', 'Cubic foot'), ('GRM', 'Gram'), ('GAK', 'Gallon (uk)'), ('GAS', 'Gallon (us)'), ('GB', 'Gigabyte'), ('GBS', 'Gigabytes per second'), ('HEC', 'Hectare'), ('HR', 'Hour'), ('INC', 'Inch'), ('IN3', 'Cubic inch'), ('KB', 'Kilobyte'), ('KBS', 'Kilobytes per second'), ('KG', 'Kilogram'), ('KM', 'Kilometer'), ('LIT', 'Liter'), ('M', 'Meter'), ('M2', 'Square meter'), ('M3', 'Cubic meter'), ('MB', 'Megabyte'), ('MBS', 'Megabytes per second'), ('MG', 'Milligram'), ('MIL', 'Mile'), ('MIN', 'Minute'), ('ML', 'Milliliter'), ('MM', 'Millimeter'), ('MON', 'Month'), ('AMO', 'Age in months'), ('NAU', 'Nautical mile'), ('NR', 'Number'), ('PAI', 'Pair'), ('PER', 'Person'), ('PIK', 'Pint (uk)'), ('PUD', 'Pint (us dry)'), ('PUL', 'Pint (us liquid)'), ('QUA', 'Quarter'), ('SEC', 'Second'), ('TON', 'Metric ton'), ('TB', 'Terabyte'), ('TBS', 'Terabytes per second'), ('TEN', 'Tens'), ('UNI', 'Unit'), ('WEE', 'Week'), ('YAR', 'Yard'), ('YA2', 'Square yard'), ('YA3', 'Cubic yard'), ('YEA', 'Year'), ('AYR', 'Age in years')], flexup_enum=product.enums.SystemUnit, max_length=3, null=True, verbose_name='System unit')),
+                ('system_unit', core.models.flexup_enum_field.FlexUpEnumField(blank=True, flexup_enum=product.enums.SystemUnit, max_length=3, null=True, verbose_name='System unit')),
                 ('custom_unit', models.CharField(blank=True, max_length=255, null=True, verbose_name='Custom unit')),
-                ('status', core.models.flexup_enum_field.FlexUpEnumField(choices=[('DR', 'Draft'), ('PS', 'Paused'), ('AC', 'Active'), ('EX', 'Expired'), ('SP', 'Suspended')], default=core.enums.status.Status['DRAFT'], flexup_enum=core.enums.status.Status, max_length=2, verbose_name='Status')),
-                ('visibility', core.models.flexup_enum_field.FlexUpEnumField(choices=[('R', 'Private'), ('B', 'Public')], default=core.enums.general.Visibility['PRIVATE'], flexup_enum=core.enums.general.Visibility, max_length=1, verbose_name='Visibility')),
-                ('focus', core.models.flexup_enum_field.FlexUpEnumField(choices=[('N', 'Normal'), ('S', 'Starred'), ('A', 'Archived')], default=core.enums.general.Focus['NORMAL'], flexup_enum=core.enums.general.Focus, max_length=1, verbose_name='Focus')),
+                ('status', core.models.flexup_enum_field.FlexUpEnumField(allowed_values=['DR', 'PS', 'AC', 'EX', 'SP'], default=core.enums.status.Status['DRAFT'], flexup_enum=core.enums.status.Status, max_length=2, verbose_name='Status')),
+                ('visibility', core.models.flexup_enum_field.FlexUpEnumField(allowed_values=['R', 'B'], default=core.enums.general.Visibility['PRIVATE'], flexup_enum=core.enums.general.Visibility, max_length=1, verbose_name='Visibility')),
+                ('focus', core.models.flexup_enum_field.FlexUpEnumField(default=core.enums.general.Focus['NORMAL'], flexup_enum=core.enums.general.Focus, max_length=1, verbose_name='Focus')),
                 ('polymorphic_ctype', models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='polymorphic_%(app_label)s.%(class)s_set+', to='contenttypes.contenttype')),
             ],
             options={
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:54
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+from core.enums.currency import Currency
+from product.conversion import refresh_normalized_price
+
+
+def backfill_normalized_price(apps, schema_editor):
+    """ Compute the normalized price of the existing products, with the last stored exchange rate of their currency (see Product.get_normalized_price). """
+    Product = apps.get_model('product', 'Product')
+    ExchangeRate = apps.get_model('core', 'ExchangeRate')
+    rates = {Currency.EUR: Decimal(1)}  # EUR is the base currency
+    for currency, rate in ExchangeRate.objects.order_by('-datetime', '-pk').values_list('currency', 'rate'):
+        rates.setdefault(currency, rate)
+    refresh_normalized_price(Product.objects.all(), rates)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('product', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='normalized_price',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=16, editable=False, max_digits=42, null=True, verbose_name='Price in EUR per base unit'),
+        ),
+        migrations.RunPython(backfill_normalized_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:55
+
+import core.enums.currency
+import core.models.flexup_enum_field
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0002_product_normalized_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepricingTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', core.models.flexup_enum_field.FlexUpEnumField(flexup_enum=core.enums.currency.Currency, max_length=3, verbose_name='Currency')),
+                ('rate', models.DecimalField(decimal_places=6, max_digits=15, verbose_name='Rate')),
+                ('last_pk', models.PositiveBigIntegerField(default=0, verbose_name='Last repriced product')),
+                ('created_datetime', models.DateTimeField(auto_now_add=True, verbose_name='Created date')),
+                ('completed_datetime', models.DateTimeField(blank=True, null=True, verbose_name='Completed date')),
+            ],
+            options={
+                'verbose_name': 'Repricing task',
+                'verbose_name_plural': 'Repricing tasks',
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:57
+
+import core.enums.currency
+import core.models.flexup_enum_field
+import django.db.models.deletion
+import product.enums
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0003_repricingtask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_currency', core.models.flexup_enum_field.FlexUpEnumField(blank=True, flexup_enum=core.enums.currency.Currency, max_length=3, null=True, verbose_name='Target currency')),
+                ('to_unit', core.models.flexup_enum_field.FlexUpEnumField(blank=True, flexup_enum=product.enums.SystemUnit, max_length=3, null=True, verbose_name='Target unit')),
+                ('rates', models.JSONField(default=dict, verbose_name='Rates')),
+                ('valid_until', models.DateTimeField(verbose_name='Rates valid until')),
+                ('max_pk', models.PositiveBigIntegerField(verbose_name='Last product')),
+                ('shard_size', models.PositiveIntegerField(verbose_name='Shard size')),
+                ('created_datetime', models.DateTimeField(auto_now_add=True, verbose_name='Created date')),
+                ('completed_datetime', models.DateTimeField(blank=True, null=True, verbose_name='Completed date')),
+            ],
+            options={
+                'verbose_name': 'Conversion run',
+                'verbose_name_plural': 'Conversion runs',
+            },
+        ),
+        migrations.CreateModel(
+            name='ConversionShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_pk', models.PositiveBigIntegerField(verbose_name='First product')),
+                ('last_pk', models.PositiveBigIntegerField(verbose_name='Last product')),
+                ('count', models.PositiveIntegerField(verbose_name='Products created')),
+                ('skipped', models.PositiveIntegerField(default=0, verbose_name='Products skipped')),
+                ('created_datetime', models.DateTimeField(auto_now_add=True, verbose_name='Created date')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='product.conversionrun', verbose_name='Run')),
+            ],
+            options={
+                'verbose_name': 'Conversion shard',
+                'verbose_name_plural': 'Conversion shards',
+                'constraints': [models.UniqueConstraint(fields=('run', 'first_pk'), name='unique_conversion_shard')],
+            },
+        ),
+    ]
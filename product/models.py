@@ -5,14 +5,22 @@ from core.enums.general import Focus, Visibility
 from core.enums.status import Status
 from core.models.flexup_enum_field import FlexUpEnumField
 from core.models.flexup_model import FlexUpModel, get_current_member
-from decimal import Decimal as Dec, ROUND_HALF_UP
+from decimal import Decimal as Dec, ROUND_HALF_UP, localcontext
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from core.models.exchange_rate import ExchangeRate
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from core.utils import convert_price
+from core.utils.convert_currency import RateSnapshot, get_stored_exchange_rate
+from core.utils.convert_price import quote_price
+from core.utils.convert_unit import get_base_unit_factor
+from product.conversion import NORMALIZED_PRICE_MAX_DIGITS, NORMALIZED_PRICE_QUANTUM, aggregate_converted_price, annotate_converted_price, convert_products, refresh_normalized_price, run_repricing_task, start_conversion_run, convert_shard
 from product.enums import ProductStatuses, SystemUnit, ProductVisibilities
 from typing import Optional
-#from polymorphic.models import PolymorphicManager
+from polymorphic.managers import PolymorphicManager
+from polymorphic.query import PolymorphicQuerySet
 
 
 class AbstractProduct(FlexUpModel):
@@ -137,6 +145,45 @@ class AbstractProduct(FlexUpModel):
 #             return all.filter(status=Status.ACTIVE, visibility=Visibility.PUBLIC)
 
 
+class ProductQuerySet(PolymorphicQuerySet):
+
+    def convert_price(self, to_currency: Currency = None, to_unit: SystemUnit = None, batch_size: int = 1000, rate_snapshot: RateSnapshot = None) -> int:
+        """ - Convert the price of all the products of the queryset, with the same results as Product.convert_price(persist=True) on each product.
+        - Returns the number of products created, see convert_products in product/conversion.py.
+        """
+        return convert_products(self, to_currency, to_unit, batch_size=batch_size, rate_snapshot=rate_snapshot)
+
+    def with_converted_price(self, to_currency: Currency, to_unit: SystemUnit = None, name: str = 'converted_price'):
+        """ - Annotate each product with its price excluding tax converted to a currency (and optionally a system unit), computed by the database.
+        - Returns the annotated queryset, see annotate_converted_price in product/conversion.py.
+        """
+        return annotate_converted_price(self, to_currency, to_unit, name=name)
+
+    def aggregate_converted_price(self, to_currency: Currency, *group_by: str, aggregate=models.Sum, to_unit: SystemUnit = None):
+        """ - Aggregate the prices converted to a currency (see with_converted_price) in the database, optionally grouped by some fields.
+        - Returns the aggregated price, or the aggregated price of each group, see aggregate_converted_price in product/conversion.py.
+        """
+        return aggregate_converted_price(self, to_currency, *group_by, aggregate=aggregate, to_unit=to_unit)
+
+    def refresh_normalized_price(self, currency: Currency = None, rate: Dec = None) -> int:
+        """ - Compute again the normalized price (see Product.get_normalized_price) of the products, with one UPDATE per currency.
+
+        - Args:
+            currency (Currency, optional): Only refresh the products in this currency (all the currencies of the queryset if not provided).
+            rate (Decimal, optional): The new exchange rate of the currency (the last stored rate if not provided).
+
+        - Returns:
+            int: The number of products updated (see refresh_normalized_price in product/conversion.py).
+        """
+        if currency:
+            rates = {currency: rate if rate is not None else get_stored_exchange_rate(currency)}
+        else:
+            currencies = self.order_by().exclude(currency=None).values_list('currency', flat=True).distinct()
+            rates = {currency: get_stored_exchange_rate(currency) for currency in set(currencies)}
+
+        return refresh_normalized_price(self, rates)
+
+
 class Product(AbstractProduct):
     class Meta:
         verbose_name = _("Product")
@@ -150,6 +197,10 @@ class Product(AbstractProduct):
     visibility = FlexUpEnumField(flexup_enum=Visibility, verbose_name=_("Visibility"), choices=ProductVisibilities, default=Visibility.PRIVATE)
     focus = FlexUpEnumField(flexup_enum=Focus, verbose_name=_("Focus"), choices=Focus.choices, default=Focus.NORMAL)
 
+# Calculated fields
+    normalized_price: Dec = models.DecimalField(max_digits=NORMALIZED_PRICE_MAX_DIGITS, decimal_places=16, verbose_name=_("Price in EUR per base unit"), null=True, blank=True, editable=False, db_index=True)
+
+    objects = PolymorphicManager.from_queryset(ProductQuerySet)()
     # visible = VisibleProductManager()
 
 # Methods
@@ -196,15 +247,17 @@ class Product(AbstractProduct):
         super().assign_values()
         
         
-    def convert_price(self, to_currency:Currency=None, to_unit:SystemUnit=None):
+    def convert_price(self, to_currency:Currency=None, to_unit:SystemUnit=None, persist:bool=False):
         """ - Convert the product's price to a different currency and unit.
         
         - Args:
             to_currency (Currency): The target currency for conversion.
             to_unit (SystemUnit): The target unit for conversion.
+            persist (bool): Create a new product with the converted price, instead of only quoting it.
 
         - Returns:
-            Product: A new product instance with the converted price, unit, and currency.
+            PriceQuote: The converted price, currency and unit, and the id of the exchange rates used (nothing is written in the database).
+            Product: If persist is True, a new product instance with the converted price, unit, and currency.
         
         -Raises:
             ValidationError: If the Price excluding Tax is not existing 
@@ -217,13 +270,16 @@ class Product(AbstractProduct):
         if not to_currency and not to_unit:
             raise ValidationError(_("You must specify either a target currency or a target unit for price conversion."))
 
-        new_price = convert_price(
+        quote = quote_price(
             self.price_excluding_tax,
             from_currency=self.currency,
             to_currency=to_currency,
             from_unit=self.system_unit or self.custom_unit,
             to_unit=to_unit,
         )
+        if not persist:
+            return quote
+
         if not to_currency:
             to_currency = self.currency
         
@@ -233,7 +289,7 @@ class Product(AbstractProduct):
         new_product = Product.objects.create(
             name=self.name,
             currency=to_currency,
-            price_excluding_tax=new_price,
+            price_excluding_tax=quote.price,
             tax_rate=self.tax_rate,
             description=self.description,
             system_unit=to_unit if isinstance(to_unit, SystemUnit) else None,
@@ -244,6 +300,26 @@ class Product(AbstractProduct):
         )
         return new_product
 
+    def get_normalized_price(self, rate: Dec = None) -> Optional[Dec]:
+        """ - Compute the price excluding tax in EUR per base unit of the product's dimension (eg. EUR per kg for any weight unit),
+        which makes the prices of all the products of a dimension comparable, whatever their currency and unit.
+
+        - Args:
+            rate (Decimal, optional): The exchange rate of the product's currency (the last stored rate if not provided, read from the rates cached for the process, never fetched from the API).
+
+        - Returns:
+            Decimal: The normalized price, or None if the product has no price, no system unit with a dimension, or no known exchange rate.
+        """
+        factor = get_base_unit_factor(self.system_unit)
+        if self.price_excluding_tax is None or factor is None or not isinstance(self.currency, Currency):
+            return None
+        if rate is None:
+            rate = get_stored_exchange_rate(self.currency)
+            if rate is None:
+                return None
+        with localcontext(prec=NORMALIZED_PRICE_MAX_DIGITS):  # the default precision (28 digits) is too short for the largest prices
+            return (Dec(self.price_excluding_tax) * rate * factor).quantize(NORMALIZED_PRICE_QUANTUM, rounding=ROUND_HALF_UP)
+
     def clean(self):
         # current_member = get_current_member()
         
@@ -260,3 +336,156 @@ class Product(AbstractProduct):
         #     raise PermissionError(_("You can't create or update a product from another account"))
         
         super().clean()
+        self.normalized_price = self.get_normalized_price()
+
+
+class RepricingTask(models.Model):
+    """ - Recomputation of the prices derived from the exchange rate of one currency (see Product.normalized_price), after the rate changed.
+    - The task is created when the rate is saved (see reprice_products), and run by the reprice_products command.
+    - The products of the currency are processed in chunks, in the order of their primary key. The watermark (last_pk) is saved with each chunk,
+      so an interrupted task resumes where it stopped.
+    - Attributes:
+        - currency (Currency): The currency whose exchange rate changed.
+        - rate (Decimal): The new exchange rate.
+        - last_pk (int): The primary key of the last product repriced.
+        - created_datetime (datetime): When the rate changed.
+        - completed_datetime (datetime, optional): When all the products were repriced (None while the task is pending).
+    """
+    class Meta:
+        verbose_name = _("Repricing task")
+        verbose_name_plural = _("Repricing tasks")
+
+# Required input fields
+    currency: Currency = FlexUpEnumField(flexup_enum=Currency, verbose_name=_("Currency"), choices=Currency.choices)
+    rate: Dec = models.DecimalField(verbose_name=_("Rate"), max_digits=15, decimal_places=6)
+
+# Calculated input fields
+    last_pk = models.PositiveBigIntegerField(verbose_name=_("Last repriced product"), default=0)
+    created_datetime = models.DateTimeField(verbose_name=_("Created date"), auto_now_add=True)
+    completed_datetime = models.DateTimeField(verbose_name=_("Completed date"), null=True, blank=True)
+
+# Methods
+    @classmethod
+    def start(cls, currency: Currency, rate: Dec) -> "RepricingTask":
+        """ Create the task repricing the products of a currency, replacing its pending tasks (they were repricing with an older rate). """
+        with transaction.atomic():
+            cls.objects.filter(currency=currency, completed_datetime=None).delete()
+            return cls.objects.create(currency=currency, rate=rate)
+
+    @classmethod
+    def resume_pending(cls, chunk_size: int = 1000) -> int:
+        """ Run all the pending tasks, oldest first, and return the number of products repriced. """
+        return sum(task.run(chunk_size) for task in cls.objects.filter(completed_datetime=None).order_by('created_datetime', 'pk'))
+
+    def run(self, chunk_size: int = 1000, max_chunks: int = None) -> int:
+        """ Reprice the products of the currency after the watermark, chunk by chunk, and return the number of products repriced (see run_repricing_task in product/conversion.py). """
+        return run_repricing_task(self, Product.objects.filter(currency=self.currency), chunk_size=chunk_size, max_chunks=max_chunks)
+
+# Labels
+    def __str__(self):
+        state = f"completed {self.completed_datetime:%Y-%m-%d %H:%M}" if self.completed_datetime else f"pending after #{self.last_pk}"
+        return f"{self.currency} @ {self.rate}, {state}"
+
+
+class ConversionRun(models.Model):
+    """ - Conversion of the price of all the products into a currency and unit, split into shards of consecutive primary keys
+    that can be converted in parallel (see the convert_products command).
+    - The shards and the rates are fixed when the run is created, so a failed run resumes with the same shards and the same rates, skipping the shards already converted.
+    - Attributes:
+        - to_currency (Currency, optional): The target currency.
+        - to_unit (SystemUnit, optional): The target unit.
+        - rates (dict): The exchange rates of the run {currency value: rate as str}, see rate_snapshot.
+        - valid_until (datetime): The date after which the rates of the run are outdated.
+        - max_pk (int): The primary key of the last product to convert (the products created by the run are not converted again).
+        - shard_size (int): The number of primary keys of each shard.
+        - created_datetime (datetime): When the run was created.
+        - completed_datetime (datetime, optional): When all the shards were converted.
+    """
+    class Meta:
+        verbose_name = _("Conversion run")
+        verbose_name_plural = _("Conversion runs")
+
+# Required input fields
+    rates = models.JSONField(verbose_name=_("Rates"), default=dict)
+    valid_until = models.DateTimeField(verbose_name=_("Rates valid until"))
+    max_pk = models.PositiveBigIntegerField(verbose_name=_("Last product"))
+    shard_size = models.PositiveIntegerField(verbose_name=_("Shard size"))
+
+# Optional fields
+    to_currency: Currency = FlexUpEnumField(flexup_enum=Currency, verbose_name=_("Target currency"), choices=Currency.choices, null=True, blank=True)
+    to_unit: SystemUnit = FlexUpEnumField(flexup_enum=SystemUnit, verbose_name=_("Target unit"), choices=SystemUnit.choices, null=True, blank=True)
+
+# Calculated input fields
+    created_datetime = models.DateTimeField(verbose_name=_("Created date"), auto_now_add=True)
+    completed_datetime = models.DateTimeField(verbose_name=_("Completed date"), null=True, blank=True)
+
+# Properties
+    @property
+    def rate_snapshot(self) -> RateSnapshot:
+        """ The exchange rates of the run, shared by all its shards. """
+        return RateSnapshot({Currency(currency): Dec(rate) for currency, rate in self.rates.items()}, self.valid_until)
+
+# Methods
+    @classmethod
+    def start(cls, to_currency: Currency = None, to_unit: SystemUnit = None, shard_size: int = 10000) -> "ConversionRun":
+        """ Create a run converting all the current products, with the current exchange rates of their currencies (see start_conversion_run in product/conversion.py). """
+        return start_conversion_run(cls, Product.objects.all(), to_currency, to_unit, shard_size=shard_size)
+
+    def get_pending_shards(self) -> list:
+        """ Return the (first_pk, last_pk) of the shards not converted yet. """
+        converted = set(self.shards.values_list('first_pk', flat=True))
+        return [
+            (first_pk, min(first_pk + self.shard_size - 1, self.max_pk))
+            for first_pk in range(1, self.max_pk + 1, self.shard_size)
+            if first_pk not in converted
+        ]
+
+    def convert_shard(self, first_pk: int, last_pk: int, batch_size: int = 1000) -> int:
+        """ Convert the products of a shard, record the shard as converted in the same transaction, and return the number of products created (see convert_shard in product/conversion.py). """
+        return convert_shard(self, Product.objects.filter(pk__gte=first_pk, pk__lte=last_pk), first_pk, last_pk, batch_size=batch_size)
+
+    def complete(self):
+        """ Record the run as completed if all its shards were converted. """
+        if not self.get_pending_shards():
+            self.completed_datetime = timezone.now()
+            self.save(update_fields=['completed_datetime'])
+
+# Labels
+    def __str__(self):
+        return f"#{self.pk} → {self.to_currency}/{self.to_unit}, products 1-{self.max_pk} by {self.shard_size}"
+
+
+class ConversionShard(models.Model):
+    """ - Checkpoint of a ConversionRun: a shard (range of primary keys) whose products were converted.
+    - Attributes:
+        - run (ConversionRun): The run of the shard.
+        - first_pk (int), last_pk (int): The range of primary keys of the shard.
+        - count (int): The number of products created.
+        - skipped (int): The number of products whose price cannot be converted (eg. a custom unit to a system unit).
+        - created_datetime (datetime): When the shard was converted.
+    """
+    class Meta:
+        verbose_name = _("Conversion shard")
+        verbose_name_plural = _("Conversion shards")
+        constraints = [models.UniqueConstraint(fields=['run', 'first_pk'], name='unique_conversion_shard')]
+
+# Required input fields
+    run = models.ForeignKey(ConversionRun, verbose_name=_("Run"), on_delete=models.CASCADE, related_name='shards')
+    first_pk = models.PositiveBigIntegerField(verbose_name=_("First product"))
+    last_pk = models.PositiveBigIntegerField(verbose_name=_("Last product"))
+    count = models.PositiveIntegerField(verbose_name=_("Products created"))
+
+# Optional fields
+    skipped = models.PositiveIntegerField(verbose_name=_("Products skipped"), default=0)
+
+# Calculated input fields
+    created_datetime = models.DateTimeField(verbose_name=_("Created date"), auto_now_add=True)
+
+
+@receiver(post_save, sender=ExchangeRate)
+def reprice_products(sender, instance, **kwargs):
+    """ - Propagate the new exchange rate of a currency: create the task repricing its products (the compiled conversions of the currency are forgotten by core, see clear_currency_conversion_plans).
+    - The task is created in the transaction saving the rate (eg. in get_exchange_rate), but it is run by the reprice_products command:
+      the products are not repriced by the request refreshing the rate, and each chunk of the task is committed on its own.
+    """
+    RepricingTask.start(instance.currency, instance.rate)
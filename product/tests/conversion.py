@@ -3,7 +3,11 @@ from django.forms import ValidationError
 from django.test import TestCase
 from core.enums.currency import Currency
 from core.utils import convert_price, convert_unit
-from core.utils.convert_currency import convert_currency, get_exchange_rate
+from core.utils.compound_unit import CompoundUnit, get_compound_factor
+from core.utils.convert_unit import convert_unit_batch, get_convertible_units, get_unit_factor
+from core.models.exchange_rate import ExchangeRate
+from core.utils.convert_currency import convert_currency, convert_currency_to_many, get_active_currencies, get_exchange_rate, get_rate_snapshot
+from core.utils.convert_price import clear_conversion_plans, compile_conversion
 from unittest.mock import patch
 
 from product.enums import SystemUnit
@@ -162,6 +166,148 @@ class AbstractConversionTest(TestCase):
         result = convert_price(self.price, self.valid_currencies["from_currency"], self.valid_currencies["to_currency"], SystemUnit.KG, SystemUnit.GRAM)
         _print_object({"input": {"price": self.price, "from_unit": SystemUnit.KG, "to_unit":  SystemUnit.GRAM,"from_currency":self.valid_currencies["from_currency"],"to_currency":self.valid_currencies["to_currency"]}, "output": Dec("0.105")})
         self.assertEqual(result, Dec('0.105'))
-        
 
+    def test_14_precomputed_unit_factors(self):
+        # The factors are exact decimals, built once for every pair of units of the same dimension
+        _print_object(print_function_name=True)
+
+        factor = get_unit_factor(SystemUnit.KG, SystemUnit.GRAM)
+        _print_object({"input": {"from_unit": SystemUnit.KG, "to_unit": SystemUnit.GRAM}, "output": factor})
+        self.assertEqual(factor, Dec("0.001"))
+        self.assertEqual(get_unit_factor(SystemUnit.DL, SystemUnit.LIT), Dec("1") / Dec("0.100000001"))
+        self.assertEqual(convert_unit(Dec("10"), SystemUnit.TON, SystemUnit.KG), Dec("0.0100"))
+        with self.assertRaises(ValidationError):
+            get_unit_factor(SystemUnit.KG, SystemUnit.LIT)
+
+    def test_15_convertible_units_index(self):
+        # Each unit can be converted to the units of its dimension only
+        _print_object(print_function_name=True)
+
+        result = get_convertible_units(SystemUnit.KG)
+        _print_object({"input": {"unit": SystemUnit.KG}, "output": result})
+        self.assertEqual(set(result), {SystemUnit.GRAM, SystemUnit.KG, SystemUnit.MG, SystemUnit.TON})
+        self.assertEqual(get_convertible_units("portion"), ())
+
+    def test_16_batch_unit_conversion_matches_scalar_conversion(self):
+        # Converting a list of prices at once gives the same results as converting them one by one
+        _print_object(print_function_name=True)
+
+        prices = [Dec("100.00"), Dec("12.3456"), Dec("0.5"), Dec("7"), Dec("42")]
+        from_units = [SystemUnit.KG, SystemUnit.DL, SystemUnit.MONTH, SystemUnit.GB, "portion"]
+        to_units = [SystemUnit.GRAM, SystemUnit.FL_OZ_US, SystemUnit.DAY, None, "portion"]
+        result = convert_unit_batch(prices, from_units, to_units)
+        expected = [convert_unit(*args) for args in zip(prices, from_units, to_units)]
+
+        _print_object({"input": {"prices": prices, "from_units": from_units, "to_units": to_units}, "output": result})
+        self.assertEqual(result, expected)
+        self.assertEqual(convert_unit_batch(prices[:2], SystemUnit.KG, SystemUnit.TON), [Dec("100000.0000"), Dec("12345.6000")])
+
+    def test_17_batch_unit_conversion_with_invalid_units(self):
+        # All the invalid pairs are reported at once, before any conversion
+        _print_object(print_function_name=True)
+
+        with self.assertRaises(ValidationError) as cm:
+            convert_unit_batch([self.price] * 3, [SystemUnit.KG, SystemUnit.KG, SystemUnit.LIT], [SystemUnit.LIT, SystemUnit.GRAM, "portion"])
+        _print_object({"output": str(cm.exception)})
+        self.assertIn("KG → LIT", str(cm.exception))
+        self.assertIn("LIT → portion", str(cm.exception))
+
+        with self.assertRaises(ValidationError):
+            convert_unit_batch([self.price] * 2, [SystemUnit.KG], SystemUnit.GRAM)
+
+    def test_18_rate_snapshot(self):
+        # The rates of several currencies are resolved at once, and give the same results as convert_currency
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.95"))
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+
+        snapshot = get_rate_snapshot([Currency.USD, Currency.JPY, Currency.EUR])
+        _print_object({"input": {"currencies": [Currency.USD, Currency.JPY, Currency.EUR]}, "output": snapshot})
+        self.assertEqual(snapshot.rates, {Currency.USD: Dec("0.95"), Currency.JPY: Dec("0.0061")})
+        self.assertEqual(snapshot.get_rate(Currency.EUR), Dec("1"))
+        self.assertTrue(snapshot.is_valid())
+        self.assertEqual(snapshot.convert(self.price, Currency.USD, Currency.JPY), convert_currency(self.price, Currency.USD, Currency.JPY))
+        self.assertEqual(snapshot.id, get_rate_snapshot([Currency.JPY, Currency.USD]).id)
+        with self.assertRaises(ValidationError):
+            snapshot.get_rate(Currency.GBP)
+
+    def test_19_compiled_conversion_plan(self):
+        # A plan converts prices along a route with one multiplication and one rounding, and is cached by route
+        _print_object(print_function_name=True)
+        clear_conversion_plans()
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.95"))
+
+        plan = compile_conversion(Currency.USD, Currency.EUR, SystemUnit.KG, SystemUnit.GRAM)
+        result = plan.convert(self.price)
+        _print_object({"input": {"price": self.price, "plan": plan}, "output": result})
+        self.assertEqual(result, Dec("0.0950"))
+        self.assertIs(compile_conversion(Currency.USD, Currency.EUR, SystemUnit.KG, SystemUnit.GRAM), plan)
+        self.assertEqual(compile_conversion(Currency.USD).convert(Dec("1.23456")), Dec("1.2346"))
+
+        clear_conversion_plans(Currency.USD)
+        self.assertIsNot(compile_conversion(Currency.USD, Currency.EUR, SystemUnit.KG, SystemUnit.GRAM), plan)
+
+        # Saving a rate of the currency forgets its plans
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.96"))
+        self.assertEqual(compile_conversion(Currency.USD, Currency.EUR, SystemUnit.KG, SystemUnit.GRAM).convert(self.price), Dec("0.0960"))
+
+    def test_20_compiled_conversion_plan_with_invalid_route(self):
+        # The route is validated once, when the plan is compiled
+        _print_object(print_function_name=True)
+        with self.assertRaises(ValidationError):
+            compile_conversion(None, Currency.EUR)
+        with self.assertRaises(ValidationError):
+            compile_conversion("INVALID", Currency.EUR)
+        with self.assertRaises(ValidationError):
+            compile_conversion(Currency.EUR, Currency.EUR, SystemUnit.KG, SystemUnit.LIT)
+
+    def test_21_compound_unit_conversion(self):
+        # Prices per compound unit (eg. per kg per month) are converted with the product of the unit factors
+        _print_object(print_function_name=True)
+        kg_day = CompoundUnit.parse("kg*day")
+        self.assertEqual(kg_day, CompoundUnit((SystemUnit.DAY, SystemUnit.KG)))
+        self.assertEqual(str(CompoundUnit.parse("KG/DAY")), "kg/day")
+
+        result = convert_unit(self.price, kg_day, CompoundUnit.parse("t·day"))
+        _print_object({"input": {"price": self.price, "from_unit": kg_day, "to_unit": "t·day"}, "output": result})
+        self.assertEqual(result, Dec("100000.0000"))
+        self.assertEqual(convert_unit(self.price, CompoundUnit.parse("kg/day"), CompoundUnit.parse("g/hr")), Dec("2.4000"))
+        self.assertEqual(convert_unit(self.price, CompoundUnit.parse("gb·month"), CompoundUnit.parse("tb·month")), Dec("100000.0000"))
+        self.assertEqual(convert_unit(self.price, SystemUnit.KG, CompoundUnit.of(SystemUnit.GRAM)), convert_unit(self.price, SystemUnit.KG, SystemUnit.GRAM))
+        self.assertEqual(convert_unit(self.price, kg_day, None), self.price)
+        self.assertEqual(convert_unit_batch([self.price], kg_day, CompoundUnit.parse("g·day")), [Dec("0.1000")])
+
+        # The factor is resolved once per pair of units
+        self.assertIs(get_compound_factor(kg_day, CompoundUnit.parse("t·day")), get_compound_factor(kg_day, CompoundUnit.parse("day·t")))
+
+    def test_22_compound_unit_conversion_with_invalid_units(self):
+        _print_object(print_function_name=True)
+        with self.assertRaises(ValidationError):
+            convert_unit(self.price, CompoundUnit.parse("kg·month"), CompoundUnit.parse("l·month"))
+        with self.assertRaises(ValidationError):
+            convert_unit(self.price, CompoundUnit.parse("kg/day"), CompoundUnit.parse("kg·day"))
+        with self.assertRaises(ValidationError):
+            CompoundUnit.parse("kg·parsec")
+        with self.assertRaises(ValidationError):
+            CompoundUnit((SystemUnit.AGE_MO,))
+
+    def test_23_fan_out_currency_conversion(self):
+        # One value is converted into many currencies with one rate snapshot, with the same results as convert_currency
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.95"))
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        ExchangeRate.objects.create(currency=Currency.GBP, rate=Dec("1.17"))
+
+        to_currencies = [Currency.JPY, Currency.EUR, Currency.GBP, Currency.USD]
+        result = convert_currency_to_many(self.price, Currency.USD, to_currencies)
+        _print_object({"input": {"price": self.price, "from_currency": Currency.USD, "to_currencies": to_currencies}, "output": result})
+        self.assertEqual(list(result), to_currencies)
+        self.assertEqual(result, {currency: convert_currency(self.price, Currency.USD, currency) for currency in to_currencies})
 
+        # All the active currencies by default
+        ExchangeRate.objects.bulk_create([ExchangeRate(currency=currency, rate=Dec("2")) for currency in get_active_currencies() if currency not in to_currencies])
+        result = convert_currency_to_many(self.price, Currency.EUR)
+        self.assertEqual(tuple(result), get_active_currencies())
+        self.assertEqual(result[Currency.AUD], Dec("50.0000"))
+        with self.assertRaises(ValidationError):
+            convert_currency_to_many(self.price, Currency.EUR, [Currency.USD, "INVALID"])
@@ -4,17 +4,26 @@
 # from account.models.legal_entity import LegalEntity
 from core.enums.country import Country
 from core.enums.currency import Currency
-from core.enums.general import Focus, Visibility
+from core.enums.general import Focus, FocusGroup, Visibility
 from core.enums.status import Status
+from core.models.exchange_rate import ExchangeRate
 from core.models.flexup_model import get_current_member, override_current_member
+from core.utils.convert_price import PriceQuote
+from core.utils.convert_unit import get_convertible_units
 from decimal import Decimal as Dec
-from django.db import Error
-from django.test import TestCase
+from django.db import Error, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Max
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase
+from io import StringIO
 from product.enums import SystemUnit
-from product.models import Product
+from product.models import ConversionRun, Product, RepricingTask
+from product.utils import export_products, import_products, read_product_rows
 
 from django.db import transaction
-from django.core.exceptions import ValidationError
+from django.core.exceptions import FieldError, ValidationError
 
 from utils.print_object import _print_object
 
@@ -293,7 +302,7 @@ class AbstractProductTest(TestCase):
         _print_object(print_function_name=True)
         
         potatoes = Product.objects.create(**self.all_details)
-        converted_product = potatoes.convert_price(to_currency=Currency.USD, to_unit=SystemUnit.GRAM)
+        converted_product = potatoes.convert_price(to_currency=Currency.USD, to_unit=SystemUnit.GRAM, persist=True)
         self.assertEqual(converted_product.currency, Currency.USD)
         self.assertEqual(converted_product.system_unit, SystemUnit.GRAM)
         
@@ -304,7 +313,7 @@ class AbstractProductTest(TestCase):
         _print_object(print_function_name=True)
         
         potatoes = Product.objects.create(**self.all_details)
-        converted_product = potatoes.convert_price(to_unit=SystemUnit.GRAM)
+        converted_product = potatoes.convert_price(to_unit=SystemUnit.GRAM, persist=True)
         self.assertEqual(converted_product.system_unit, SystemUnit.GRAM)
         self.assertEqual(converted_product.currency, potatoes.currency)
         self.assertEqual(converted_product.price_excluding_tax,Dec("0.1000"))
@@ -317,8 +326,425 @@ class AbstractProductTest(TestCase):
         _print_object(print_function_name=True)
         
         potatoes = Product.objects.create(**self.all_details)
-        converted_product = potatoes.convert_price(to_currency=Currency.USD)
+        converted_product = potatoes.convert_price(to_currency=Currency.USD, persist=True)
         self.assertEqual(converted_product.currency, Currency.USD)
         self.assertEqual(converted_product.system_unit,potatoes.system_unit)
         
         _print_object({"input": {**self.all_details}, "output":{converted_product.system_unit.value,converted_product.currency.value,converted_product.name,converted_product.price_excluding_tax}})
+
+    def test_16_bulk_convert_price(self):
+        # Given products in several currencies and units, with fresh exchange rates
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.95"))
+        potatoes = Product.objects.create(**self.all_details)
+        computer = Product.objects.create(**{**self.minimum_details, "system_unit": SystemUnit.TON})
+        Product.objects.create(name="Gift", currency=Currency.USD)  # no price: skipped
+
+        # When the whole queryset is converted
+        count = Product.objects.filter(pk__in=[potatoes.pk, computer.pk]).convert_price(to_currency=Currency.USD, to_unit=SystemUnit.GRAM, batch_size=1)
+
+        # Then the new products have the same prices as with Product.convert_price
+        converted_products = Product.objects.exclude(pk__in=[potatoes.pk, computer.pk]).exclude(name="Gift").order_by("name")
+        _print_object({"input": {"products": [potatoes, computer]}, "output": list(converted_products)})
+        self.assertEqual(count, 2)
+        self.assertEqual(len(converted_products), 2)
+        for product, converted_product in zip([computer, potatoes], converted_products):
+            expected_product = product.convert_price(to_currency=Currency.USD, to_unit=SystemUnit.GRAM, persist=True)
+            self.assertEqual(converted_product.price_excluding_tax, expected_product.price_excluding_tax)
+            self.assertEqual(converted_product.currency, Currency.USD)
+            self.assertEqual(converted_product.system_unit, SystemUnit.GRAM)
+            self.assertEqual(converted_product.status, product.status)
+            self.assertIsInstance(converted_product, Product)
+
+    def test_17_bulk_convert_price_of_all_products(self):
+        # Given more products than the batch size, in the whole table
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        for i in range(5):
+            Product.objects.create(**{**self.all_details, "name": f"Potatoes {i}"})
+
+        # When all the products are converted, the products created during the conversion are not converted again
+        count = Product.objects.all().convert_price(to_unit=SystemUnit.GRAM, batch_size=2)
+
+        _print_object({"input": {"products": 5, "batch_size": 2}, "output": count})
+        self.assertEqual(count, 5)
+        self.assertEqual(Product.objects.count(), 10)
+        self.assertEqual(Product.objects.filter(system_unit=SystemUnit.GRAM).count(), 5)
+
+    def test_18_bulk_convert_price_with_invalid_units(self):
+        # Nothing is created if the price of any product cannot be converted
+        _print_object(print_function_name=True)
+        Product.objects.create(**self.all_details)
+        Product.objects.create(**self.custom_unit_details)
+
+        with self.assertRaises(ValidationError):
+            Product.objects.all().convert_price(to_unit=SystemUnit.GRAM)
+        with self.assertRaises(ValidationError):
+            Product.objects.all().convert_price()
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_19_quote_price_without_persisting(self):
+        # By default, convert_price returns a quote and does not create any product
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.95"))
+        potatoes = Product.objects.create(**self.all_details)
+
+        quote = potatoes.convert_price(to_currency=Currency.USD, to_unit=SystemUnit.GRAM)
+        _print_object({"input": {**self.all_details}, "output": quote})
+        self.assertIsInstance(quote, PriceQuote)
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(quote.currency, Currency.USD)
+        self.assertEqual(quote.unit, SystemUnit.GRAM)
+        self.assertEqual(quote.price, potatoes.convert_price(to_currency=Currency.USD, to_unit=SystemUnit.GRAM, persist=True).price_excluding_tax)
+        self.assertEqual(len(quote.rate_snapshot_id), 12)
+        with self.assertRaises(AttributeError):
+            quote.price = Dec("0")
+
+        # Without a change of currency, no exchange rate is needed
+        quote = Product(**self.custom_unit_details).convert_price(to_unit="portion")
+        self.assertEqual((quote.price, quote.currency, quote.unit), (Dec("5.00"), Currency.USD, "portion"))
+
+    def test_20_converted_price_annotation(self):
+        # Given products in several currencies and units, with fresh exchange rates
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.95"))
+        potatoes = Product.objects.create(**self.all_details)                                           # 100 JPY/kg
+        computer = Product.objects.create(**{**self.minimum_details, "system_unit": SystemUnit.TON})  # 1000 USD/t
+        Product.objects.create(name="Flour", price_excluding_tax=Dec("2"), currency=Currency.EUR, system_unit=SystemUnit.KG)
+        Product.objects.create(**self.custom_unit_details)
+
+        # When the products are annotated with their price in USD per gram
+        products = Product.objects.with_converted_price(Currency.USD, SystemUnit.GRAM).order_by("converted_price")
+        result = {product.name: product.converted_price for product in products}
+
+        # Then the converted prices are computed by the database, and can be sorted and filtered
+        _print_object({"input": {"to_currency": Currency.USD, "to_unit": SystemUnit.GRAM}, "output": result})
+        self.assertEqual(result["Potatoes"], potatoes.convert_price(to_currency=Currency.USD, to_unit=SystemUnit.GRAM).price)
+        self.assertEqual(result["Computer"], computer.convert_price(to_currency=Currency.USD, to_unit=SystemUnit.GRAM).price)
+        self.assertEqual(result["Flour"], Dec("0.0021"))
+        self.assertIsNone(result["Cake"])  # custom unit
+        self.assertEqual([product.name for product in products if product.converted_price is not None], ["Potatoes", "Computer", "Flour"])
+        self.assertEqual(Product.objects.with_converted_price(Currency.USD, SystemUnit.GRAM).filter(converted_price__gte=Dec("0.001")).count(), 2)
+
+        # Without a target unit, the unit of each product is kept
+        result = {product.name: product.converted_price for product in Product.objects.with_converted_price(Currency.EUR)}
+        self.assertEqual(result["Cake"], Dec("4.7500"))
+        self.assertEqual(result["Flour"], Dec("2.0000"))
+        with self.assertRaises(ValidationError):
+            Product.objects.with_converted_price(Currency.EUR, "portion")
+
+    def test_21_normalized_price(self):
+        # Given products in several currencies and weight units
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        potatoes = Product.objects.create(**self.all_details)                                                                              # 100 JPY/kg
+        flour = Product.objects.create(name="Flour", price_excluding_tax=Dec("0.002"), currency=Currency.EUR, system_unit=SystemUnit.GRAM)  # 0.002 EUR/g
+        cake = Product.objects.create(**self.custom_unit_details)
+
+        # Then their prices are stored in EUR per kg, and can be compared in the database
+        _print_object({"input": [potatoes, flour, cake], "output": [potatoes.normalized_price, flour.normalized_price, cake.normalized_price]})
+        self.assertEqual(potatoes.normalized_price, Dec("0.61"))
+        self.assertEqual(flour.normalized_price, Dec("2"))
+        self.assertIsNone(cake.normalized_price)
+        cheapest = Product.objects.filter(system_unit__in=get_convertible_units(SystemUnit.KG)).order_by("normalized_price")
+        self.assertEqual([product.name for product in cheapest], ["Potatoes", "Flour"])
+
+        # When the rate of a currency is refreshed, the normalized prices of its products are updated by the repricing task
+        ExchangeRate.objects.filter(currency=Currency.JPY).delete()
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.05"))
+        call_command("reprice_products", stdout=StringIO())
+        potatoes.refresh_from_db()
+        flour.refresh_from_db()
+        self.assertEqual(potatoes.normalized_price, Dec("5"))
+        self.assertEqual(flour.normalized_price, Dec("2"))
+        self.assertEqual([product.name for product in cheapest.all()], ["Flour", "Potatoes"])
+        self.assertEqual(Product.objects.refresh_normalized_price(), 3)
+
+    def test_22_normalized_price_range(self):
+        # Given the highest price per mg, in a currency with a high exchange rate
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.KWD, rate=Dec("999999999.999999"))
+        Product.objects.create(name="Flour", price_excluding_tax=Dec("1"), currency=Currency.KWD, system_unit=SystemUnit.KG)
+        saffron = Product(name="Saffron", price_excluding_tax=Dec("99999999999.9999"), currency=Currency.KWD, system_unit=SystemUnit.MG)
+
+        # Then the normalized price fits the column, and the stored rates are read from the cache (no query on save)
+        with self.assertNumQueries(1):
+            saffron.save()
+        _print_object({"input": saffron, "output": saffron.normalized_price})
+        Product._meta.get_field("normalized_price").run_validators(saffron.normalized_price)
+        self.assertEqual(Product.objects.order_by("-normalized_price").first(), saffron)
+
+    def test_23_incremental_repricing(self):
+        # Given products in JPY and EUR
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        potatoes = Product.objects.create(**self.all_details)
+        rice = Product.objects.create(**{**self.all_details, "name": "Rice", "price_excluding_tax": Dec("200.00")})
+        flour = Product.objects.create(name="Flour", price_excluding_tax=Dec("2"), currency=Currency.EUR, system_unit=SystemUnit.KG)
+
+        # When a repricing task is interrupted after its first chunk
+        task = RepricingTask.start(Currency.JPY, Dec("0.05"))
+        self.assertEqual(task.run(chunk_size=1, max_chunks=1), 1)
+
+        # Then the watermark is saved, and only the products of the currency are repriced when the task resumes
+        _print_object({"input": {"currency": Currency.JPY, "rate": Dec("0.05")}, "output": RepricingTask.objects.get(pk=task.pk)})
+        self.assertEqual(RepricingTask.objects.get(pk=task.pk).last_pk, potatoes.pk)
+        self.assertEqual(RepricingTask.resume_pending(chunk_size=1), 1)
+        self.assertIsNotNone(RepricingTask.objects.get(pk=task.pk).completed_datetime)
+        self.assertEqual([product.normalized_price for product in Product.objects.filter(pk__in=[potatoes.pk, rice.pk, flour.pk]).order_by("pk")], [Dec("5"), Dec("10"), Dec("2")])
+
+        # When a new rate is stored, a task is created, and its products are repriced when the pending tasks run
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.006"))
+        self.assertEqual(Product.objects.get(pk=rice.pk).normalized_price, Dec("10"))
+        self.assertEqual(RepricingTask.objects.filter(completed_datetime=None).count(), 1)
+        call_command("reprice_products", stdout=StringIO())
+        self.assertEqual(Product.objects.get(pk=rice.pk).normalized_price, Dec("1.2"))
+        self.assertFalse(RepricingTask.objects.filter(completed_datetime=None).exists())
+
+    def test_24_streaming_export(self):
+        # Given products with and without a convertible unit
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.95"))
+        potatoes = Product.objects.create(**self.all_details)
+        cake = Product.objects.create(**self.custom_unit_details)
+
+        # When the catalog is exported with prices in EUR and USD per gram
+        rows = export_products(currencies=[Currency.EUR, Currency.USD], to_unit=SystemUnit.GRAM, chunk_size=1)
+        _print_object({"input": {"currencies": [Currency.EUR, Currency.USD], "to_unit": SystemUnit.GRAM}, "output": rows})
+        self.assertFalse(isinstance(rows, list))  # streamed
+        rows = list(rows)
+
+        # Then each row has the converted prices, like Product.convert_price
+        self.assertEqual([row["id"] for row in rows], [potatoes.pk, cake.pk])
+        self.assertEqual(rows[0]["price_USD"], potatoes.convert_price(to_currency=Currency.USD, to_unit=SystemUnit.GRAM).price)
+        self.assertEqual(rows[0]["price_EUR"], potatoes.convert_price(to_currency=Currency.EUR, to_unit=SystemUnit.GRAM).price)
+        self.assertEqual(rows[0]["unit"], "KG")  # the unit of price_excluding_tax
+        self.assertEqual(rows[0]["price_unit"], "GRM")
+        self.assertEqual(rows[1]["unit"], "portion")
+        self.assertIsNone(rows[1]["price_EUR"])  # custom unit
+
+        # The command writes the same rows as CSV or JSON Lines
+        output = StringIO()
+        call_command("export_products", "--currency", "usd", stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "id,name,description,status,visibility,focus,currency,price_excluding_tax,tax_rate,unit,price_unit,price_USD")
+        self.assertEqual(len(lines), 3)
+        output = StringIO()
+        call_command("export_products", "--format", "jsonl", stdout=output)
+        self.assertIn('"price_excluding_tax": "5.0000"', output.getvalue().splitlines()[1])
+
+    def test_25_sharded_conversion_with_resume(self):
+        # Given 3 products, and a conversion run split into shards of 2 primary keys
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.95"))
+        products = [Product.objects.create(**self.all_details), Product.objects.create(**self.minimum_details), Product.objects.create(**self.all_details)]
+        run = ConversionRun.start(Currency.USD, shard_size=2)
+        first_pk = products[0].pk
+
+        # When the first shard is converted, and the run then fails
+        shards = run.get_pending_shards()
+        self.assertEqual(len(shards), (products[-1].pk + 1) // 2)
+        self.assertEqual(run.convert_shard(*shards[0]), len([pk for pk in range(shards[0][0], shards[0][1] + 1) if pk >= first_pk]))
+
+        # Then the run resumes from the next shard, with the rates it started with
+        ExchangeRate.objects.filter(currency=Currency.JPY).update(rate=Dec("1"))
+        output = StringIO()
+        call_command("convert_products", "--resume", run.pk, "--workers", 1, stdout=output)
+        _print_object({"input": {"run": run}, "output": output.getvalue()})
+        run.refresh_from_db()
+        self.assertIsNotNone(run.completed_datetime)
+        self.assertEqual(sum(run.shards.values_list("count", flat=True)), 3)
+        converted = Product.objects.filter(pk__gt=run.max_pk, name="Potatoes").values_list("price_excluding_tax", flat=True)
+        self.assertEqual(list(converted), [Dec("0.6421")] * 2)
+
+    def test_26_sharded_conversion_with_unconvertible_products(self):
+        # Given a product whose unit cannot be converted, in the same shard as a convertible product
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.95"))
+        potatoes = Product.objects.create(**self.all_details)
+        Product.objects.create(**self.custom_unit_details)
+        run = ConversionRun.start(to_unit=SystemUnit.GRAM, shard_size=100)
+
+        # When the run is converted (one worker by default with SQLite)
+        output = StringIO()
+        call_command("convert_products", "--resume", run.pk, stdout=output, stderr=StringIO())
+
+        # Then the unconvertible product is skipped, and the shard and the run are completed
+        _print_object({"input": {"run": run}, "output": output.getvalue()})
+        run.refresh_from_db()
+        self.assertIsNotNone(run.completed_datetime)
+        self.assertEqual(list(run.shards.values_list("count", "skipped")), [(1, 1)])
+        self.assertEqual(Product.objects.get(pk__gt=run.max_pk).price_excluding_tax, potatoes.price_excluding_tax / 1000)
+
+    def test_27_streaming_import(self):
+        # Given a CSV catalog with valid and invalid rows
+        _print_object(print_function_name=True)
+        catalog = StringIO(
+            "name,currency,price_excluding_tax,tax_rate,unit,status\n"
+            "Potatoes,JPY,100,20,kg,AC\n"               # line 2
+            "Milk,eur,1.2346,5.5,fl-oz-us,\n"           # line 3
+            "Cake,USD,5,10,portion,DR\n"                # line 4
+            "Gold,USD,10,300,g,DR\n"                    # line 5: invalid tax rate
+            "Silver,XYZ,10,,g,DR\n"                     # line 6: invalid currency
+            "Copper,USD,10.12345,,t,DR\n"               # line 7: too many decimals, like when saving a product
+            "Zinc,USD,10,,t,PE\n"                       # line 8: status not allowed for products
+        )
+
+        # When the catalog is imported in batches of 2
+        count, errors = import_products(read_product_rows(catalog), batch_size=2)
+
+        # Then the valid rows are created with the rules of Product.clean, and the invalid rows are reported
+        _print_object({"input": catalog.getvalue(), "output": {"count": count, "errors": errors}})
+        self.assertEqual(count, 3)
+        self.assertEqual([line_number for line_number, _message in errors], [5, 6, 7, 8])
+        milk = Product.objects.get(name="Milk")
+        self.assertEqual((milk.currency, milk.system_unit, milk.price_excluding_tax, milk.tax_rate, milk.status), (Currency.EUR, SystemUnit.FL_OZ_US, Dec("1.2346"), Dec("5.50"), Status.DRAFT))
+        self.assertAlmostEqual(milk.normalized_price, milk.get_normalized_price(), places=10)
+        cake = Product.objects.get(name="Cake")
+        self.assertEqual((cake.system_unit, cake.custom_unit), (None, "portion"))
+        self.assertIsInstance(Product.objects.get(name="Potatoes"), Product)
+
+        # JSON Lines are imported the same way, and the export can be imported again
+        count, errors = import_products(read_product_rows(StringIO('{"name": "Rice", "currency": "EUR", "price_excluding_tax": 2.5, "unit": "KG"}\n{bad\n[1]\n42\n'), "jsonl"))
+        self.assertEqual((count, [line_number for line_number, _message in errors]), (1, [2, 3, 4]))
+        self.assertEqual(import_products((index, row) for index, row in enumerate(export_products()))[0], 4)
+
+        # An unknown format is rejected, and the command only accepts the known formats
+        with self.assertRaises(ValidationError):
+            import_products(read_product_rows(StringIO(""), "xml"))
+        with self.assertRaises(CommandError):
+            call_command("import_products", "catalog.xml", "--format", "xml")
+
+    def test_28_aggregate_converted_price(self):
+        # Given active products in several currencies and focuses
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        ExchangeRate.objects.create(currency=Currency.USD, rate=Dec("0.95"))
+        potatoes = Product.objects.create(**self.all_details)                                                               # starred
+        rice = Product.objects.create(**{**self.all_details, "name": "Rice", "currency": Currency.EUR, "focus": Focus.NORMAL})
+        computer = Product.objects.create(**{**self.minimum_details, "status": Status.ACTIVE})                            # normal
+        Product.objects.create(**{**self.minimum_details, "name": "Draft"})
+
+        # When the prices are summed in USD by focus, in the database
+        products = Product.objects.filter(status=Status.ACTIVE)
+        result = products.aggregate_converted_price(Currency.USD, "focus")
+
+        # Then the totals are the sums of the converted prices
+        _print_object({"input": {"to_currency": Currency.USD, "group_by": "focus"}, "output": result})
+        usd_price = lambda product: product.convert_price(to_currency=Currency.USD).price
+        self.assertEqual(result, {Focus.NORMAL: usd_price(rice) + usd_price(computer), Focus.STARRED: usd_price(potatoes)})
+        self.assertEqual(products.aggregate_converted_price(Currency.USD), usd_price(rice) + usd_price(computer) + usd_price(potatoes))
+        self.assertEqual(products.aggregate_converted_price(Currency.EUR, aggregate=Max), Dec("950"))
+        self.assertEqual(set(products.aggregate_converted_price(Currency.EUR, "focus", "currency")), {(Focus.NORMAL, Currency.EUR), (Focus.NORMAL, Currency.USD), (Focus.STARRED, Currency.JPY)})
+
+    def test_29_order_by_enum_sort_key(self):
+        # Given products with units of different dimensions
+        _print_object(print_function_name=True)
+        for name, unit in (("Milk", SystemUnit.LIT), ("Potatoes", SystemUnit.KG), ("Cleaning", SystemUnit.HR), ("Bag", SystemUnit.UNIT)):
+            Product.objects.create(**{**self.all_details, "name": name, "system_unit": unit})
+        Product.objects.create(**self.custom_unit_details)
+
+        # When the products are ordered by the sort factor of their unit, in the database
+        result = list(Product.objects.order_by(SystemUnit.sort_case("system_unit", "sort_factor", default=1000)).values_list("name", flat=True))
+
+        # Then they are in the same order as the units sorted in Python, the custom unit last
+        _print_object({"input": {"sort": "sort_factor"}, "output": result})
+        self.assertEqual(result, ["Bag", "Cleaning", "Potatoes", "Milk", "Cake"])
+        units = [SystemUnit.LIT, SystemUnit.KG, SystemUnit.HR, SystemUnit.UNIT]
+        self.assertEqual(sorted(units, key=lambda unit: unit.sort_factor), [SystemUnit.UNIT, SystemUnit.HR, SystemUnit.KG, SystemUnit.LIT])
+        self.assertEqual(list(Product.objects.filter(system_unit__isnull=False).order_by(SystemUnit.sort_case("system_unit")).values_list("system_unit", flat=True)), sorted(units))
+
+        # Properties holding enum items are sorted by the position of the items, and lazy labels by their translation
+        by_dimension = Product.objects.filter(system_unit__isnull=False).order_by(SystemUnit.sort_case("system_unit", "dimension"), "name")
+        self.assertEqual(list(by_dimension.values_list("system_unit", flat=True)), sorted(units, key=lambda unit: (unit.dimension, unit.name)))
+        by_label = Product.objects.filter(system_unit__isnull=False).order_by(SystemUnit.sort_case("system_unit", "label"))
+        self.assertEqual(list(by_label.values_list("system_unit", flat=True)), sorted(units, key=lambda unit: str(unit.label)))
+
+    def test_30_filter_by_enum_property(self):
+        # Given products with an active and an inactive currency, different units and different focuses
+        _print_object(print_function_name=True)
+        Product.objects.create(**self.all_details)                                                                            # JPY, KG, starred
+        Product.objects.create(**{**self.all_details, "name": "Bolivar", "currency": Currency.VEF, "focus": Focus.ARCHIVED})  # inactive currency
+        Product.objects.create(**{**self.all_details, "name": "Hosting", "system_unit": SystemUnit.MB_S, "focus": Focus.NORMAL})
+
+        # When the products are filtered by the properties of their enum fields, in the database
+        names = lambda products: sorted(products.values_list("name", flat=True))
+        active = Product.objects.filter(currency__prop_is_active=True)
+        default_focus = Product.objects.filter(focus__in_group=FocusGroup.DEFAULT)
+
+        # Then the filters are IN lists of the matching values
+        _print_object({"input": {"currency__prop_is_active": True}, "output": names(active)})
+        self.assertEqual(names(active), ["Hosting", "Potatoes"])
+        self.assertIn(" IN (", str(active.query))
+        self.assertEqual(names(Product.objects.filter(currency__prop_is_active=False)), ["Bolivar"])
+        self.assertEqual(names(default_focus), ["Hosting", "Potatoes"])
+        self.assertEqual(names(Product.objects.filter(system_unit__prop_can_be_priced=False)), ["Hosting"])
+        self.assertEqual(names(Product.objects.filter(system_unit__prop_dimension=SystemUnit.KG.dimension)), ["Bolivar", "Potatoes"])
+        self.assertEqual(names(Product.objects.filter(currency__prop_symbol="nothing")), [])
+        self.assertEqual(names(Product.objects.filter(system_unit__prop_dimension=None)), [])  # the units without dimension (eg. AGE_MO)
+        Product.objects.create(**{**self.all_details, "name": "Calf", "system_unit": SystemUnit.AGE_MO})
+        self.assertEqual(names(Product.objects.filter(system_unit__prop_dimension=None)), ["Calf"])
+        with self.assertRaises(FieldError):
+            Product.objects.filter(focus__in_group=Currency.EUR)
+        with self.assertRaisesMessage(FieldError, "Focus has no property 'nope'"):
+            Product.objects.filter(focus__prop_nope=1)
+
+
+class RepricingTaskTest(TransactionTestCase):
+    """ Repricing after a rate change, with real commits (the chunks of a task are committed on their own). """
+
+    def test_01_repricing_outside_of_the_rate_transaction(self):
+        # Given products in JPY, with a stored rate
+        _print_object(print_function_name=True)
+        ExchangeRate.objects.create(currency=Currency.JPY, rate=Dec("0.0061"))
+        RepricingTask.resume_pending()
+        potatoes = Product.objects.create(name="Potatoes", price_excluding_tax=Dec("100"), currency=Currency.JPY, system_unit=SystemUnit.KG)
+        rice = Product.objects.create(name="Rice", price_excluding_tax=Dec("200"), currency=Currency.JPY, system_unit=SystemUnit.KG)
+
+        # When the rate is refreshed in a transaction that is rolled back, no task is left
+        with self.assertRaises(Error):
+            with transaction.atomic():
+                ExchangeRate.objects.update_or_create(currency=Currency.JPY, defaults={"rate": Dec("0.04")})
+                raise Error("interrupted")
+        self.assertFalse(RepricingTask.objects.filter(completed_datetime=None).exists())
+
+        # When the rate is refreshed in a transaction (like get_exchange_rate), the products are not repriced by the transaction
+        with transaction.atomic():
+            ExchangeRate.objects.update_or_create(currency=Currency.JPY, defaults={"rate": Dec("0.05")})
+        self.assertEqual(Product.objects.get(pk=potatoes.pk).normalized_price, Dec("0.61"))
+        task = RepricingTask.objects.get(completed_datetime=None)
+
+        # Then the task commits its watermark with each chunk, and is resumed by the command
+        self.assertEqual(task.run(chunk_size=1, max_chunks=1), 1)
+        _print_object({"input": {"currency": Currency.JPY, "rate": Dec("0.05")}, "output": RepricingTask.objects.get(pk=task.pk)})
+        self.assertEqual(RepricingTask.objects.get(pk=task.pk).last_pk, potatoes.pk)
+        call_command("reprice_products", chunk_size=1, stdout=StringIO())
+        self.assertIsNotNone(RepricingTask.objects.get(pk=task.pk).completed_datetime)
+        self.assertEqual([product.normalized_price for product in Product.objects.order_by("pk")], [Dec("5"), Dec("10")])
+
+    def test_02_normalized_price_backfilled_by_the_migration(self):
+        # Given a product and a rate stored before the migration adding the normalized price
+        _print_object(print_function_name=True)
+        executor = MigrationExecutor(connection)
+        executor.migrate([("product", "0001_initial")])
+        old_apps = executor.loader.project_state([("product", "0001_initial")]).apps
+        ExchangeRate.objects.bulk_create([ExchangeRate(currency=Currency.JPY, rate=Dec("0.0061"))])  # without the receivers: the tables of the later migrations do not exist yet
+        OldProduct = old_apps.get_model("product", "Product")
+        ctype_id = ContentType.objects.get_for_model(Product).pk
+        potatoes = OldProduct.objects.create(name="Potatoes", price_excluding_tax=Dec("100"), currency=Currency.JPY, system_unit=SystemUnit.GRAM, polymorphic_ctype_id=ctype_id)
+        cash = OldProduct.objects.create(name="Cash", price_excluding_tax=Dec("100"), currency=Currency.JPY, polymorphic_ctype_id=ctype_id)
+
+        # When the migrations are applied
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+        # Then the normalized price of the existing products is computed with the stored rate
+        _print_object({"input": {"currency": Currency.JPY, "rate": Dec("0.0061")}, "output": list(Product.objects.values_list("name", "normalized_price"))})
+        self.assertEqual(Product.objects.get(pk=potatoes.pk).normalized_price, Dec("610"))
+        self.assertIsNone(Product.objects.get(pk=cash.pk).normalized_price)
@@ -0,0 +1,181 @@
+import csv
+import json
+from decimal import ROUND_HALF_UP
+
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+
+from core.enums.currency import Currency
+from core.utils.find_unit import find_system_unit
+from core.utils.convert_currency import cache_stored_exchange_rates, get_rate_snapshot
+from core.utils.convert_unit import PRICE_QUANTUM, resolve_unit_factor
+from product.enums import SystemUnit
+from product.models import Product
+
+IMPORT_COLUMNS = ['name', 'description', 'status', 'visibility', 'focus', 'currency', 'price_excluding_tax', 'tax_rate', 'unit', 'system_unit', 'custom_unit']
+EXPORT_COLUMNS = ['id', 'name', 'description', 'status', 'visibility', 'focus', 'currency', 'price_excluding_tax', 'tax_rate', 'unit']
+
+
+def export_products(products=None, currencies=(), to_unit: SystemUnit = None, chunk_size: int = 1000):
+    """ - Stream the products as rows (dict), with their price converted into each of the requested currencies, in constant memory.
+    - The products are read with iterator(chunk_size), and the exchange rates are resolved once for the whole export.
+
+    - Args:
+        products (ProductQuerySet, optional): The products to export (all the products if not provided).
+        currencies (iterable of Currency): The currencies to convert the prices into (one 'price_<currency>' column each, after a 'price_unit' column).
+        to_unit (SystemUnit, optional): The unit of the converted prices, in the 'price_unit' column (the unit of each product if not provided).
+          The 'unit' column is always the unit of the product, the unit of its price excluding tax.
+        chunk_size (int): The number of products read from the database at once.
+
+    - Yields:
+        dict: The row of each product: the EXPORT_COLUMNS, then, if currencies are requested, the unit and the converted prices (None if the price or unit cannot be converted).
+
+    - Raises:
+        ValidationError: If a requested currency is invalid.
+    """
+    currencies = list(currencies)
+    if any(not isinstance(currency, Currency) for currency in currencies):
+        raise ValidationError(_('One or more provided currencies are invalid.'))
+    products = (products if products is not None else Product.objects.all()).non_polymorphic().order_by('pk')
+    rate_snapshot = None
+    if currencies:
+        rate_snapshot = get_rate_snapshot(set(currencies) | set(products.order_by().values_list('currency', flat=True).distinct()))
+
+    unit_factors = {}  # {(from_unit, to_unit): factor, or False if the units cannot be converted}
+    for product in products.iterator(chunk_size=chunk_size):
+        from_unit = product.system_unit or product.custom_unit
+        row = {
+            'id': product.pk,
+            'name': product.name,
+            'description': product.description,
+            'status': product.status.value,
+            'visibility': product.visibility.value,
+            'focus': product.focus.value,
+            'currency': product.currency.value if product.currency else None,
+            'price_excluding_tax': product.price_excluding_tax,
+            'tax_rate': product.tax_rate,
+            'unit': getattr(from_unit, 'value', from_unit),
+            # 'unit': getattr(to_unit or from_unit, 'value', to_unit or from_unit),  # replaced: the unit must be the one of price_excluding_tax, the target unit is in price_unit
+        }
+        if currencies:
+            row['price_unit'] = getattr(to_unit or from_unit, 'value', to_unit or from_unit)
+            unit_factor = unit_factors.get((from_unit, to_unit))
+            if unit_factor is None:
+                try:
+                    unit_factor = unit_factors[(from_unit, to_unit)] = resolve_unit_factor(from_unit, to_unit) or 1
+                except ValidationError:
+                    unit_factor = unit_factors[(from_unit, to_unit)] = False
+            for currency in currencies:
+                price = None
+                if product.price_excluding_tax is not None and product.currency and unit_factor:
+                    # Same rounding steps as convert_price: currency first, then unit
+                    price = rate_snapshot.convert(product.price_excluding_tax, product.currency, currency)
+                    if unit_factor != 1:
+                        price = (price * unit_factor).quantize(PRICE_QUANTUM, rounding=ROUND_HALF_UP)
+                row[f'price_{currency.value}'] = price
+        yield row
+
+
+def write_products_csv(rows, stream, currencies=()):
+    """ Write the rows of export_products to a text stream, as CSV with a header line. Return the number of rows written. """
+    writer = csv.DictWriter(stream, fieldnames=EXPORT_COLUMNS + (['price_unit'] if currencies else []) + [f'price_{currency.value}' for currency in currencies])
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_products_jsonl(rows, stream):
+    """ Write the rows of export_products to a text stream, as JSON Lines (decimals as strings). Return the number of rows written. """
+    count = 0
+    for row in rows:
+        stream.write(json.dumps(row, default=str, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+def read_product_rows(stream, format: str = 'csv'):
+    """ - Stream the rows (dict) of a CSV file with a header line, or of a JSON Lines file (one object per line).
+    - Yields:
+        - tuple: The line number and the row. A JSON line that cannot be parsed is yielded as its error message (str) instead of a row.
+    - Raises:
+        - ValidationError: If the format is not csv or jsonl (when the first row is read).
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, f"Invalid JSON: {e}"
+    else:
+        raise ValidationError(_(f"Unknown format: {format}. The format must be csv or jsonl."))
+
+
+def product_from_row(row: dict) -> Product:
+    """ - Build a product (not saved, not validated) from an imported row (see IMPORT_COLUMNS, the other columns are ignored).
+    - The unit column is resolved to a system unit from its symbol (eg. "kg", "fl-oz-us") or value (eg. "KG"), and is a custom unit otherwise.
+    - Empty values are None, and the status, visibility and focus keep their default if empty.
+    - Raises:
+        - ValidationError: If the row is not an object (eg. a JSON line holding a list or a number).
+    """
+    if not isinstance(row, dict):
+        raise ValidationError(_(f"The row must be an object, not: {json.dumps(row)}"))
+    values = {column: (value.strip() if isinstance(value, str) else value) for column, value in row.items() if column in IMPORT_COLUMNS}
+    values = {column: value for column, value in values.items() if value not in ('', None)}
+    unit = values.pop('unit', None)
+    if unit is not None and 'system_unit' not in values and 'custom_unit' not in values:
+        try:
+            values['system_unit'] = find_system_unit(str(unit))
+        except ValidationError:
+            values['custom_unit'] = str(unit)
+    if isinstance(values.get('system_unit'), str):
+        values['system_unit'] = find_system_unit(values['system_unit'])
+    for column in ('currency', 'status', 'visibility', 'focus'):
+        if isinstance(values.get(column), str):
+            values[column] = values[column].upper()
+    return Product(**values)
+
+
+def import_products(rows, batch_size: int = 1000) -> tuple:
+    """ - Create products from imported rows (see read_product_rows), in batches with bulk_create.
+    - Each row is validated with the same rules as saving a product (full_clean, hence AbstractProduct.clean and Product.clean),
+      without the per-row database writes. The invalid rows are reported, and do not prevent the other rows of their batch from being created.
+
+    - Args:
+        rows (iterable): The (line number, row) of each product, as yielded by read_product_rows.
+        batch_size (int): The number of products created at once.
+
+    - Returns:
+        tuple: The number of products created, and the list of (line number, error message) of the invalid rows.
+    """
+    count = 0
+    errors = []
+    products = []
+    with cache_stored_exchange_rates():
+        for line_number, row in rows:
+            try:
+                if isinstance(row, str):
+                    raise ValidationError(row)
+                product = product_from_row(row)
+                product.full_clean(validate_unique=False)
+            except ValidationError as e:
+                errors.append((line_number, "; ".join(e.messages)))
+                continue
+            except (ValueError, TypeError, ArithmeticError) as e:
+                errors.append((line_number, str(e)))
+                continue
+            product.pre_save_polymorphic()
+            products.append(product)
+            if len(products) >= batch_size:
+                count += len(Product.objects.bulk_create(products))
+                products = []
+        if products:
+            count += len(Product.objects.bulk_create(products))
+    return count, errors
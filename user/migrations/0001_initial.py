@@ -23,7 +23,7 @@ class Migration(migrations.Migration):
                 ('email', models.EmailField(max_length=254, unique=True)),
                 ('is_superuser', models.BooleanField(default=False)),
                 ('is_staff', models.BooleanField(default=False)),
-                ('status', core.models.flexup_enum_field.FlexUpEnumField(choices=[('PE', 'Pending'), ('AC', 'Active'), ('CL', 'Closed'), ('SP', 'Suspended')], default=core.enums.status.Status['PENDING'], flexup_enum=core.enums.status.Status, max_length=2)),
+                ('status', core.models.flexup_enum_field.FlexUpEnumField(allowed_values=['PE', 'AC', 'CL', 'SP'], default=core.enums.status.Status['PENDING'], flexup_enum=core.enums.status.Status, max_length=2)),
                 ('is_email_verified', models.BooleanField(default=False)),
                 ('joined_datetime', models.DateTimeField(auto_now_add=True)),
                 ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
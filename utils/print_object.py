@@ -1,5 +1,4 @@
 # ---------- utils/print_object.py
-from django.test import TestCase
 import inspect
 import os
 
@@ -124,6 +123,7 @@ def is_print_activated():
     
     # If debug_setting is 'test', only print in test methods
     if debug_setting == 'test':
+        from django.test import TestCase  # imported here: django.test is slow to import, and only needed when printing
         frame = inspect.currentframe()
         if frame:
             caller_frame = frame.f_back